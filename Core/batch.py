@@ -0,0 +1,96 @@
+# batch.py
+
+import re
+import sys
+from typing import Iterable, TextIO
+
+from Core.interpreter import MyInteractiveInterpreter
+from Core.jobs import JobManager
+from Core.parallel import ParallelPool
+from Core.magic_commands import MagicCommandHandler
+from Core.system import CAPTURE_COMMAND, ShellEscape
+
+DEDENT_KEYWORDS = re.compile(r"(elif|else|except\*?|finally)\b")  # 续接上一个复合语句的子句
+
+
+class BatchRunner:
+    """
+    无终端渲染的批处理模式：逐行读取输入流，语句一旦完整立即执行。
+    复合语句在遇到下一条顶格语句（或输入结束）时执行，块内空行不会提前结束语句。
+    不依赖 prompt_toolkit，适用于管道与自动化脚本。
+    """
+
+    def __init__(self, filename: str = "<stdin>") -> None:
+        self.filename = filename
+        self.interpreter = MyInteractiveInterpreter(blank_line_ends_block=False)
+        self.jobs = JobManager(self.interpreter)
+        self.parallel = ParallelPool(self.interpreter)
+        self.system = ShellEscape()
+        self.input_count = 1
+        self.magic_command_handler = MagicCommandHandler(self)
+
+    def _starts_new_statement(self, line: str) -> bool:
+        """
+        顶格且非续行关键字的行意味着上一个复合语句已结束。
+        """
+        if not line.strip() or line[0] in " \t#":
+            return False
+        return not DEDENT_KEYWORDS.match(line)
+
+    def _finish(self) -> None:
+        """
+        输入结束时执行缓冲区中剩余的代码，不完整则报告语法错误。
+        """
+        if self.interpreter.buffer:
+            self.interpreter.run_pending(self.filename)
+
+    def handle_line(self, line: str) -> bool:
+        """
+        处理一行输入。
+        :return: False 表示收到 exit，应停止读取
+        """
+        line = line.rstrip("\r\n")
+        tracker = self.interpreter.tracker
+        if tracker.can_close() and self._starts_new_statement(line):
+            # 顶格语句结束上一个复合语句，等价于交互模式下输入空行
+            self.interpreter.run_pending(self.filename)
+            self.input_count += 1
+        if not self.interpreter.buffer:
+            stripped = line.strip()
+            if stripped == "exit":
+                return False
+            if not stripped:
+                return True
+            if stripped.startswith("!"):
+                self.system.run(stripped[1:])
+                self.input_count += 1
+                return True
+            if match := CAPTURE_COMMAND.match(stripped):
+                self.interpreter.locals[match[1]] = self.system.run(match[2], capture=True)
+                self.input_count += 1
+                return True
+            if stripped.startswith("%"):
+                self.magic_command_handler.handle_magic_command(stripped)
+                self.input_count += 1
+                return True
+        if not self.interpreter.runsource(line, self.filename):
+            self.input_count += 1
+        return True
+
+    def run(self, stream: Iterable[str]) -> None:
+        """
+        流式读取并执行，直到输入结束或遇到 exit，退出前等待后台作业结束。
+        """
+        for line in stream:
+            if not self.handle_line(line):
+                break
+        self._finish()
+        self.system.stop_persistent()
+        self.jobs.wait_all()
+
+
+def run_batch(stream: TextIO = None) -> None:
+    """
+    以批处理模式执行输入流（默认 stdin）。
+    """
+    BatchRunner().run(stream if stream is not None else sys.stdin)
@@ -0,0 +1,183 @@
+# bytecode_cache.py
+
+import hashlib
+import importlib.util
+import marshal
+import os
+import struct
+import sys
+import tempfile
+from types import CodeType
+from typing import Optional
+
+# 缓存文件头：自有标识、Python 字节码 magic、源文件 mtime_ns、大小、内容哈希
+_CACHE_MAGIC = b"SPBC"
+_HEADER = struct.Struct("<4s4sQQ16s")
+_SUFFIX = f".{sys.implementation.cache_tag}.spc"
+
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024  # 默认缓存目录上限 256 MB
+
+
+def user_cache_dir() -> str:
+    """
+    SinglePython 的用户缓存根目录（Windows 下位于 LOCALAPPDATA，其他系统遵循 XDG_CACHE_HOME）。
+    """
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "SinglePython")
+
+
+def default_cache_dir() -> str:
+    """
+    默认缓存目录，可通过环境变量 SINGLEPYTHON_CACHE_DIR 覆盖。
+    """
+    if env_dir := os.environ.get("SINGLEPYTHON_CACHE_DIR"):
+        return env_dir
+    return os.path.join(user_cache_dir(), "bytecode")
+
+
+def default_max_size() -> int:
+    """
+    默认缓存大小上限（字节），可通过环境变量 SINGLEPYTHON_CACHE_SIZE 覆盖。
+    """
+    try:
+        return int(os.environ.get("SINGLEPYTHON_CACHE_SIZE", DEFAULT_MAX_SIZE))
+    except ValueError:
+        return DEFAULT_MAX_SIZE
+
+
+class BytecodeCache:
+    """
+    基于 marshal 的持久化代码对象缓存，类似 __pycache__。
+    以路径、mtime、大小和内容哈希为键；写入先落临时文件再原子替换，支持多进程并发写入；
+    超出大小上限时按最近使用时间淘汰。
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, max_size: Optional[int] = None) -> None:
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_size = default_max_size() if max_size is None else max_size
+
+    def _entry_path(self, filename: str) -> str:
+        key = hashlib.sha1(os.path.abspath(filename).encode("utf-8", "surrogatepass")).hexdigest()
+        return os.path.join(self.cache_dir, key + _SUFFIX)
+
+    @staticmethod
+    def _digest(source: str) -> bytes:
+        return hashlib.blake2b(source.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+    def load(self, filename: str, source: str, st: os.stat_result) -> Optional[CodeType]:
+        """
+        读取缓存的代码对象，键不匹配或文件损坏时返回 None。
+        """
+        entry = self._entry_path(filename)
+        try:
+            with open(entry, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        if len(data) < _HEADER.size:
+            return None
+        magic, py_magic, mtime_ns, size, digest = _HEADER.unpack_from(data)
+        if (magic != _CACHE_MAGIC or py_magic != importlib.util.MAGIC_NUMBER
+                or mtime_ns != st.st_mtime_ns or size != st.st_size
+                or digest != self._digest(source)):
+            return None
+        try:
+            codes = marshal.loads(memoryview(data)[_HEADER.size:])
+        except (EOFError, ValueError, TypeError):
+            return None
+        if not isinstance(codes, CodeType):
+            return None
+        # 更新访问时间，作为 LRU 淘汰依据
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+        return codes
+
+    def store(self, filename: str, source: str, st: os.stat_result, codes: CodeType) -> None:
+        """
+        写入缓存：临时文件 + os.replace 原子替换，失败时静默忽略。
+        """
+        header = _HEADER.pack(_CACHE_MAGIC, importlib.util.MAGIC_NUMBER,
+                              st.st_mtime_ns, st.st_size, self._digest(source))
+        payload = header + marshal.dumps(codes)
+        if self.max_size and len(payload) > self.max_size:
+            return
+        tmp_path = None
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(payload)
+            os.replace(tmp_path, self._entry_path(filename))
+            tmp_path = None
+            self.evict()
+        except OSError:
+            pass
+        finally:
+            if tmp_path is not None:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+
+    def evict(self) -> None:
+        """
+        缓存总大小超过上限时，按 mtime 从旧到新删除条目。
+        """
+        if not self.max_size:
+            return
+        entries = []
+        total = 0
+        try:
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    if not entry.name.endswith(".spc"):
+                        continue
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime_ns, st.st_size, entry.path))
+                    total += st.st_size
+        except OSError:
+            return
+        if total <= self.max_size:
+            return
+        entries.sort()
+        for _, size, path in entries:
+            try:
+                os.unlink(path)
+            except OSError:
+                continue  # 其他进程可能已删除
+            total -= size
+            if total <= self.max_size:
+                break
+
+    def clear(self) -> None:
+        """
+        清空缓存目录下的所有缓存条目。
+        """
+        try:
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    if entry.name.endswith(".spc"):
+                        try:
+                            os.unlink(entry.path)
+                        except OSError:
+                            pass
+        except OSError:
+            pass
+
+    def compile(self, source: str, filename: str, st: os.stat_result) -> CodeType:
+        """
+        优先读取缓存，未命中时编译并写入缓存。
+        """
+        codes = self.load(filename, source, st)
+        if codes is None:
+            codes = compile(source, filename, "exec")
+            self.store(filename, source, st, codes)
+        return codes
@@ -0,0 +1,331 @@
+# checkpoint.py
+
+import hashlib
+import importlib
+import io
+import json
+import marshal
+import os
+import pickle
+import sys
+import tempfile
+import time
+import types
+import weakref
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from Core.bytecode_cache import user_cache_dir
+
+_MANIFEST = "manifest.json"
+_MANIFEST_VERSION = 1
+OUT_OF_BAND_THRESHOLD = 64 * 1024  # 小于该字节数的缓冲区直接写入 pickle 流
+# 不可变的标量：对象未变（is 相同）即可跳过，无需重新 pickle 与计算哈希
+_IMMUTABLE_TYPES = (type(None), bool, int, float, complex, str, bytes, range)
+
+# 载入期间会话函数的全局命名空间
+_LOAD_NAMESPACE: Dict[str, Any] = {}
+
+
+def default_checkpoint_dir() -> str:
+    """
+    命名空间快照的默认目录，可通过环境变量 SINGLEPYTHON_NS_DIR 覆盖。
+    """
+    if env_dir := os.environ.get("SINGLEPYTHON_NS_DIR"):
+        return env_dir
+    return os.path.join(user_cache_dir(), "namespace")
+
+
+def _restore_function(code: bytes, name: str, qualname: str, defaults: Optional[tuple],
+                      kwdefaults: Optional[dict]) -> types.FunctionType:
+    func = types.FunctionType(marshal.loads(code), _LOAD_NAMESPACE, name, defaults)
+    func.__qualname__ = qualname
+    func.__kwdefaults__ = kwdefaults
+    return func
+
+
+def _restore_bytearray(buffer) -> bytearray:
+    # 带外缓冲区载入时本身就是可写的 bytearray，直接使用，无需复制
+    return buffer if type(buffer) is bytearray else bytearray(buffer)
+
+
+class _OutOfBand:
+    """
+    pickle 对 bytes/bytearray 走内置的快速路径（不经过 reducer_override），总是写入 pickle 流；
+    顶层的大 bytes/bytearray 经由该包装以 PickleBuffer 写成带外缓冲区。
+    """
+
+    def __init__(self, value) -> None:
+        self.value = value
+
+    def __reduce_ex__(self, protocol):
+        restore = bytes if type(self.value) is bytes else _restore_bytearray
+        return restore, (pickle.PickleBuffer(self.value),)
+
+
+def _fingerprint(value: Any) -> Tuple[Any, ...]:
+    """
+    可变对象的廉价指纹（id、类型、长度与大小），用于增量保存时跳过未变的大对象。
+    """
+    try:
+        length = len(value)
+    except Exception:
+        length = None
+    try:
+        size = sys.getsizeof(value)
+    except Exception:
+        size = None
+    return id(value), type(value), length, size, getattr(value, "nbytes", None)
+
+
+class _SessionPickler(pickle.Pickler):
+    """
+    会话中定义的函数无法按引用 pickle，改为保存字节码，载入时以会话命名空间为全局变量重建。
+    """
+
+    def __init__(self, file, session_name: Optional[str], buffer_callback) -> None:
+        super().__init__(file, protocol=5, buffer_callback=buffer_callback)
+        self.session_name = session_name
+
+    def reducer_override(self, obj):
+        if (type(obj) is types.FunctionType and obj.__module__ == self.session_name
+                and not obj.__closure__):
+            return _restore_function, (marshal.dumps(obj.__code__), obj.__name__, obj.__qualname__,
+                                       obj.__defaults__, obj.__kwdefaults__)
+        return NotImplemented
+
+
+def _write_atomic(path: str, chunks: Iterable) -> int:
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in chunks:
+                size += f.write(chunk)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    return size
+
+
+def _read_buffer(path: str) -> bytearray:
+    """
+    直接读入可写的 bytearray，numpy 等对象可原地使用，无需再复制。
+    """
+    with open(path, "rb", buffering=0) as f:
+        buffer = bytearray(os.fstat(f.fileno()).st_size)
+        view = memoryview(buffer)
+        offset = 0
+        while offset < len(buffer):
+            read = f.readinto(view[offset:])
+            if not read:
+                raise EOFError(f"{path} is truncated")
+            offset += read
+    return buffer
+
+
+@dataclass
+class CheckpointReport:
+    written: List[str] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)
+    skipped: List[Tuple[str, str]] = field(default_factory=list)  # (变量名, 原因)
+    bytes: int = 0
+    elapsed: float = 0.0
+
+
+class NamespaceCheckpoint:
+    """
+    将会话命名空间保存到目录：每个变量用 pickle 协议 5 单独序列化，大块二进制数据
+    （如 numpy 数组）作为带外缓冲区原样写成单独的文件，载入时直接读回，无需经过 pickle 流复制。
+    对象文件按内容哈希命名，manifest.json 记录变量名到哈希的映射并最后原子替换；
+    再次保存时只写入内容哈希有变化的变量；未变的不可变对象、指纹未变的可变对象连 pickle 都会跳过。
+    模块按名字记录，载入时重新导入；无法 pickle 的变量跳过并报告原因。
+    """
+
+    def __init__(self, namespace: Dict[str, Any], exclude: Iterable[Any] = ()) -> None:
+        self.namespace = namespace
+        self._exclude = {id(value) for value in exclude}  # 会话自身的对象（如 Out 缓存）不保存
+        # 目录 -> {变量名: (上次保存的对象或其弱引用, 指纹, 内容哈希)}
+        self._identity: Dict[str, Dict[str, Tuple[Any, Optional[tuple], str]]] = {}
+
+    @staticmethod
+    def _remember(value: Any) -> Tuple[Any, Optional[tuple]]:
+        """
+        不可变对象直接持有；可变对象记录指纹，能弱引用时再加弱引用，避免 id 被新对象复用后误判。
+        """
+        if type(value) in _IMMUTABLE_TYPES:
+            return value, None
+        try:
+            holder = weakref.ref(value)
+        except TypeError:
+            holder = None
+        return holder, _fingerprint(value)
+
+    @staticmethod
+    def _unchanged(cached: Tuple[Any, Optional[tuple], str], value: Any) -> bool:
+        holder, fingerprint, _ = cached
+        if fingerprint is None:
+            return holder is value
+        if isinstance(holder, weakref.ref) and holder() is not value:
+            return False
+        return fingerprint == _fingerprint(value)
+
+    @staticmethod
+    def _read_manifest(directory: str) -> Dict[str, Any]:
+        try:
+            with open(os.path.join(directory, _MANIFEST), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if manifest.get("version") != _MANIFEST_VERSION:
+            return {}
+        return manifest
+
+    def _serialize(self, value: Any) -> Tuple[bytes, List[pickle.PickleBuffer], str]:
+        buffers: List[pickle.PickleBuffer] = []
+
+        def buffer_callback(buffer: pickle.PickleBuffer) -> bool:
+            try:
+                if buffer.raw().nbytes < OUT_OF_BAND_THRESHOLD:
+                    return True
+            except BufferError:
+                return True  # 非连续内存只能写入 pickle 流
+            buffers.append(buffer)
+            return False
+
+        if type(value) in (bytes, bytearray) and len(value) >= OUT_OF_BAND_THRESHOLD:
+            value = _OutOfBand(value)
+        stream = io.BytesIO()
+        _SessionPickler(stream, self.namespace.get("__name__"), buffer_callback).dump(value)
+        data = stream.getvalue()
+        digest = hashlib.blake2b(data, digest_size=16)
+        for buffer in buffers:
+            raw = buffer.raw()
+            digest.update(raw.nbytes.to_bytes(8, "little"))
+            digest.update(raw)
+        return data, buffers, digest.hexdigest()
+
+    def save(self, directory: Optional[str] = None, names: Optional[Iterable[str]] = None,
+             force: bool = False) -> CheckpointReport:
+        """
+        保存变量到快照目录。可变对象的指纹（长度、大小）未变时视为未变，
+        不改变大小的原地修改（如 a[0] = 1）因此不会被发现，需用 force 重新序列化。
+        :param names: 只保存这些变量并保留快照中的其他变量；为 None 时保存整个命名空间
+        :param force: 忽略指纹，重新序列化每个变量（内容哈希未变的仍不会重写文件）
+        """
+        start = time.perf_counter()
+        directory = os.path.abspath(directory or default_checkpoint_dir())
+        objects_dir = os.path.join(directory, "objects")
+        os.makedirs(objects_dir, exist_ok=True)
+        previous = self._read_manifest(directory).get("variables", {})
+        identity = self._identity.setdefault(directory, {})
+        report = CheckpointReport()
+        if names is None:
+            variables: Dict[str, Any] = {}
+            names = [name for name, value in self.namespace.items()
+                     if not name.startswith("_") and id(value) not in self._exclude]
+        else:
+            variables = {name: entry for name, entry in previous.items()}
+        for name in names:
+            if name not in self.namespace:
+                report.skipped.append((name, "not defined"))
+                continue
+            value = self.namespace[name]
+            if isinstance(value, types.ModuleType):
+                variables[name] = {"kind": "module", "module": value.__name__}
+                report.unchanged.append(name)
+                continue
+            old = previous.get(name, {})
+            cached = identity.get(name)
+            if (not force and cached is not None and self._unchanged(cached, value)
+                    and old.get("digest") == cached[2]
+                    and os.path.exists(os.path.join(objects_dir, f"{cached[2]}.pkl"))):
+                variables[name] = old
+                report.unchanged.append(name)
+                continue
+            try:
+                data, buffers, digest = self._serialize(value)
+            except Exception as e:
+                report.skipped.append((name, f"{type(e).__name__}: {e}"))
+                variables.pop(name, None)
+                continue
+            pickle_path = os.path.join(objects_dir, f"{digest}.pkl")
+            if not os.path.exists(pickle_path):
+                for i, buffer in enumerate(buffers):
+                    report.bytes += _write_atomic(os.path.join(objects_dir, f"{digest}.{i}.buf"), [buffer.raw()])
+                # pickle 流最后写入：它存在即表示缓冲区文件已完整
+                report.bytes += _write_atomic(pickle_path, [data])
+                report.written.append(name)
+            else:
+                report.unchanged.append(name)
+            variables[name] = {"kind": "pickle", "digest": digest, "buffers": len(buffers),
+                               "type": type(value).__name__}
+            identity[name] = (*self._remember(value), digest)
+        manifest = {"version": _MANIFEST_VERSION, "python": sys.implementation.cache_tag,
+                    "saved": time.time(), "variables": variables}
+        _write_atomic(os.path.join(directory, _MANIFEST),
+                      [json.dumps(manifest, ensure_ascii=False, indent=1).encode("utf-8")])
+        self._collect_garbage(objects_dir, variables)
+        report.elapsed = time.perf_counter() - start
+        return report
+
+    @staticmethod
+    def _collect_garbage(objects_dir: str, variables: Dict[str, Any]) -> None:
+        """
+        删除 manifest 不再引用的对象文件。
+        """
+        live = {entry["digest"] for entry in variables.values() if entry.get("kind") == "pickle"}
+        with os.scandir(objects_dir) as entries:
+            for entry in entries:
+                if entry.name.partition(".")[0] not in live:
+                    try:
+                        os.unlink(entry.path)
+                    except OSError:
+                        pass
+
+    def load(self, directory: Optional[str] = None, names: Optional[Iterable[str]] = None) -> CheckpointReport:
+        """
+        从快照目录恢复变量到命名空间，载入失败的变量跳过并报告原因。
+        :param names: 只恢复这些变量；为 None 时恢复全部
+        """
+        global _LOAD_NAMESPACE
+        start = time.perf_counter()
+        directory = os.path.abspath(directory or default_checkpoint_dir())
+        manifest = self._read_manifest(directory)
+        if not manifest:
+            raise FileNotFoundError(f"No namespace snapshot in {directory}")
+        variables = manifest.get("variables", {})
+        objects_dir = os.path.join(directory, "objects")
+        identity = self._identity.setdefault(directory, {})
+        report = CheckpointReport()
+        _LOAD_NAMESPACE = self.namespace
+        for name in variables if names is None else names:
+            entry = variables.get(name)
+            if entry is None:
+                report.skipped.append((name, "not in snapshot"))
+                continue
+            try:
+                if entry["kind"] == "module":
+                    value = importlib.import_module(entry["module"])
+                else:
+                    digest = entry["digest"]
+                    buffers = [_read_buffer(os.path.join(objects_dir, f"{digest}.{i}.buf"))
+                               for i in range(entry["buffers"])]
+                    with open(os.path.join(objects_dir, f"{digest}.pkl"), "rb") as f:
+                        data = f.read()
+                    report.bytes += len(data) + sum(len(buffer) for buffer in buffers)
+                    value = pickle.loads(data, buffers=buffers)
+            except Exception as e:
+                report.skipped.append((name, f"{type(e).__name__}: {e}"))
+                continue
+            self.namespace[name] = value
+            report.written.append(name)
+            if entry["kind"] == "pickle":
+                identity[name] = (*self._remember(value), entry["digest"])
+        report.elapsed = time.perf_counter() - start
+        return report
@@ -0,0 +1,175 @@
+# completion.py
+
+import builtins
+import keyword
+import re
+import sys
+import threading
+import types
+import weakref
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Tuple
+
+from prompt_toolkit.completion import Completer, Completion
+
+from Core.module_index import ModuleIndex
+
+_IMPORT_FROM = re.compile(r"^\s*from\s+([\w.]+)\s+import\s+(?:[\w\s,]*,\s*)?(\w*)$")
+_IMPORT = re.compile(r"^\s*(?:import|from)\s+(?:[\w.\s]*,\s*)?([\w.]*)$")
+_ATTRIBUTE = re.compile(r"(?<![\w.)\]}'\"])([A-Za-z_][\w.]*)\.(\w*)$")
+_NAME = re.compile(r"(?<![\w.])([A-Za-z_]\w*)$")
+
+
+def _prefix_range(names: List[str], prefix: str) -> List[str]:
+    """
+    在已排序的名字列表中二分查找给定前缀的所有名字。
+    """
+    start = bisect_left(names, prefix)
+    end = bisect_left(names, prefix + "\U0010ffff", start)
+    return names[start:end]
+
+
+class CompletionIndex:
+    """
+    补全索引：命名空间中的名字、对象属性与可导入模块（见 ModuleIndex）都预先排好序，按前缀二分查找。
+    索引在后台线程中构建，每执行完一段输入后只合并命名空间中新增/删除的名字，
+    补全时不遍历命名空间，也不在按键时重新计算。
+    """
+
+    def __init__(self, namespace: dict) -> None:
+        self.namespace = namespace
+        self._static = set(dir(builtins)) | set(keyword.kwlist)
+        self._keys: frozenset = frozenset()
+        self._names: List[str] = sorted(self._static)
+        # id(对象) -> (弱引用, __dict__ 大小, 已排序的属性名)
+        self._attributes: Dict[int, Tuple[weakref.ref, int, List[str]]] = {}
+        self.module_index = ModuleIndex()
+        self._dirty = threading.Event()
+        self._dirty.set()
+        self._thread = threading.Thread(target=self._worker, name="completion-index", daemon=True)
+        self._thread.start()
+
+    def refresh(self) -> None:
+        """
+        通知后台线程命名空间可能已变化（每执行完一段输入调用一次）。
+        """
+        self._dirty.set()
+
+    def _worker(self) -> None:
+        self.module_index.start()
+        while True:
+            self._dirty.wait()
+            self._dirty.clear()
+            try:
+                self._update_names()
+            except Exception:
+                pass  # 索引只影响补全，不能让后台线程退出
+
+    def _update_names(self) -> None:
+        keys = frozenset(list(self.namespace))
+        if keys == self._keys:
+            return
+        added, removed = keys - self._keys, self._keys - keys
+        if len(added) + len(removed) > len(keys) // 2:
+            names = sorted(keys | self._static)
+        else:
+            names = [name for name in self._names if name not in removed or name in self._static]
+            for name in sorted(added - self._static):
+                names.insert(bisect_left(names, name), name)
+        self._keys, self._names = keys, names
+        # 预先为新导入的模块建立属性列表，首次补全 module.<Tab> 时无需等待
+        for name in added:
+            value = self.namespace.get(name)
+            if isinstance(value, types.ModuleType):
+                self.attributes(value)
+
+    def attributes(self, obj) -> List[str]:
+        """
+        对象的已排序属性名；可弱引用的对象按 id 缓存，属性数量变化时重新计算。
+        """
+        count = len(getattr(obj, "__dict__", None) or ())
+        cached = self._attributes.get(id(obj))
+        if cached is not None:
+            ref, cached_count, names = cached
+            if ref() is obj and cached_count == count:
+                return names
+        try:
+            names = sorted(set(dir(obj)))
+        except Exception:
+            return []
+        key = id(obj)
+        try:
+            ref = weakref.ref(obj, lambda _, key=key: self._attributes.pop(key, None))
+        except TypeError:
+            return names  # 不可弱引用的对象（int、str 等）属性少，无需缓存
+        self._attributes[key] = (ref, count, names)
+        return names
+
+    def names(self, prefix: str) -> List[str]:
+        return _prefix_range(self._names, prefix)
+
+    def modules(self, prefix: str) -> List[str]:
+        """
+        可导入模块名补全，索引尚未载入时只列出已导入的模块。
+        """
+        if self.module_index.ready.is_set():
+            return self.module_index.complete(prefix)
+        return _prefix_range(sorted(name for name in sys.modules
+                                    if name.rpartition(".")[0] == prefix.rpartition(".")[0]), prefix)
+
+    def resolve(self, expr: str):
+        """
+        在命名空间中解析点号表达式（只做名字查找与 getattr，不执行调用）。
+        """
+        first, *rest = expr.split(".")
+        if first in self.namespace:
+            obj = self.namespace[first]
+        elif hasattr(builtins, first):
+            obj = getattr(builtins, first)
+        else:
+            raise LookupError(first)
+        for attr in rest:
+            obj = getattr(obj, attr)
+        return obj
+
+
+class PythonCompleter(Completer):
+    """
+    prompt_toolkit 补全器：import 语句补全模块名，obj.attr 补全属性，其余补全命名空间中的名字。
+    以下划线开头的名字只在输入了下划线时列出。应包在 ThreadedCompleter 中使用，避免阻塞提示符。
+    """
+
+    def __init__(self, index: CompletionIndex) -> None:
+        self.index = index
+
+    @staticmethod
+    def _completions(candidates: List[str], partial: str) -> Iterable[Completion]:
+        hide_private = not partial.startswith("_")
+        for name in candidates:
+            if hide_private and name.rpartition(".")[2].startswith("_"):
+                continue
+            yield Completion(name, start_position=-len(partial))
+
+    def get_completions(self, document, complete_event) -> Iterable[Completion]:
+        line = document.current_line_before_cursor
+        if match := _IMPORT_FROM.match(line):
+            module_name, partial = match.groups()
+            candidates = set(self.index.modules(f"{module_name}.{partial}"))
+            candidates = {name.rpartition(".")[2] for name in candidates}
+            if module := sys.modules.get(module_name):
+                candidates.update(_prefix_range(self.index.attributes(module), partial))
+            yield from self._completions(sorted(candidates), partial)
+        elif match := _IMPORT.match(line):
+            partial = match.group(1)
+            for completion in self._completions(self.index.modules(partial), partial.rpartition(".")[2]):
+                yield Completion(completion.text, start_position=-len(partial))
+        elif match := _ATTRIBUTE.search(line):
+            expr, partial = match.groups()
+            try:
+                obj = self.index.resolve(expr)
+            except Exception:
+                return
+            yield from self._completions(_prefix_range(self.index.attributes(obj), partial), partial)
+        elif match := _NAME.search(line):
+            partial = match.group(1)
+            yield from self._completions(self.index.names(partial), partial)
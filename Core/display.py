@@ -0,0 +1,253 @@
+# display.py
+
+import array
+import os
+import reprlib
+import shutil
+import subprocess
+import sys
+import time
+from collections import Counter, OrderedDict, UserDict, UserList, UserString, defaultdict, deque
+from collections.abc import Mapping, Sequence
+from typing import Any, Iterator, Optional, Tuple
+
+from Core.utils import color_print
+
+DEFAULT_DISPLAY_LIMIT = 4000  # 字符
+DEFAULT_DISPLAY_TIME = 0.1  # 秒
+_CHUNK = 4096  # 长字符串按块生成 repr
+_MAX_DEPTH = 64
+_SMALL_CONTAINER = 1000  # 元素不超过该数目的容器子类直接调用 repr
+
+
+def _env_number(name: str, default, cast):
+    try:
+        return cast(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _iter_text_repr(value) -> Iterator[str]:
+    """
+    分块生成长 str/bytes/bytearray（及未自定义 __repr__ 的子类）的 repr，与 repr(value) 结果一致，
+    但不需要一次性构造整个字符串。
+    """
+    is_bytes = not isinstance(value, str)
+    wrapped = isinstance(value, bytearray)
+    single, double = (b"'", b'"') if is_bytes else ("'", '"')
+    quote = '"' if single in value and double not in value else "'"
+    if wrapped:
+        yield f"{type(value).__name__}("
+    yield f"b{quote}" if is_bytes else quote
+    for start in range(0, len(value), _CHUNK):
+        piece = value[start:start + _CHUNK]
+        piece = repr(bytes(piece) if wrapped else piece)
+        if is_bytes:
+            piece = piece[1:]
+        inner = piece[1:-1]
+        if piece[0] != quote:
+            # 分块自身选择了另一种引号，按整体的引号补上转义
+            inner = inner.replace("'", "\\'")
+        yield inner
+    yield quote
+    if wrapped:
+        yield ")"
+
+
+def _iter_array_repr(value: array.array) -> Iterator[str]:
+    """
+    分块生成 array.array 的 repr，如 array('i', [1, 2, 3])。
+    """
+    yield f"{type(value).__name__}({value.typecode!r}"
+    if not value:
+        yield ")"
+        return
+    if value.typecode == "u":
+        yield ", "
+        yield from _iter_text_repr(value.tounicode())
+        yield ")"
+        return
+    yield ", ["
+    for start in range(0, len(value), _CHUNK):
+        if start:
+            yield ", "
+        yield repr(value[start:start + _CHUNK].tolist())[1:-1]
+    yield "])"
+
+
+_TEXT_REPRS = (str.__repr__, bytes.__repr__, bytearray.__repr__)
+
+
+def _capped_repr(max_chars: int) -> reprlib.Repr:
+    """
+    其他对象的 repr 无法分块生成，按 reprlib 的上限截断；上限比显示预算多一个字符，截断后仍会给出摘要行。
+    """
+    limits = reprlib.Repr()
+    limits.maxlevel = _MAX_DEPTH
+    limits.maxstring = limits.maxlong = limits.maxother = max_chars + 1
+    limits.maxtuple = limits.maxlist = limits.maxarray = _SMALL_CONTAINER
+    limits.maxdict = limits.maxset = limits.maxfrozenset = limits.maxdeque = _SMALL_CONTAINER
+    return limits
+
+
+# 内置容器的括号；未自定义 __repr__ 的子类与 UserDict/UserList 的 repr 与之相同
+_BRACKETS = {list: ("[", "]"), tuple: ("(", ")"), dict: ("{", "}"),
+             set: ("{", "}"), frozenset: ("frozenset({", "})")}
+_PLAIN_REPRS = {dict.__repr__: ("{", "}", "mapping"), UserDict.__repr__: ("{", "}", "mapping"),
+                list.__repr__: ("[", "]", "items"), UserList.__repr__: ("[", "]", "items"),
+                tuple.__repr__: ("(", ")", "items")}
+# 这些 repr 带类名前缀，如 Counter({...})、MySet({...})
+_PREFIXED_REPRS = {set.__repr__, frozenset.__repr__, deque.__repr__, defaultdict.__repr__,
+                   OrderedDict.__repr__, Counter.__repr__, object.__repr__}
+_NOT_CONTAINERS = (str, bytes, bytearray, memoryview, range, UserString)
+
+
+def _layout(value: Any) -> Optional[Tuple[str, str, str]]:
+    """
+    可以逐个元素流式生成 repr 的容器：返回 (开头, 结尾, 元素形式)，否则返回 None。
+    元素形式为 "mapping"（键: 值）、"pairs"（(键, 值) 元组）或 "items"（逐个元素）。
+    子类与 collections 类型的元素较少时返回 None，直接使用 repr 以保证结果完全一致；
+    元素很多时按插入顺序流式生成（例如 Counter 不再按计数排序）。
+    未定义 __repr__ 的 Mapping/Sequence 也按 类名({...}) / 类名([...]) 的形式显示内容。
+    """
+    kind = type(value)
+    if kind in _BRACKETS:
+        return (*_BRACKETS[kind], "mapping" if kind is dict else "items")
+    if isinstance(value, _NOT_CONTAINERS) or not isinstance(value, (Mapping, Sequence, set, frozenset, deque)):
+        return None
+    method = kind.__repr__
+    if method not in _PLAIN_REPRS and method not in _PREFIXED_REPRS:
+        return None  # 自定义了 __repr__
+    try:
+        if len(value) <= _SMALL_CONTAINER:
+            return None
+    except Exception:
+        return None
+    if method in _PLAIN_REPRS:
+        return _PLAIN_REPRS[method]
+    name = kind.__name__
+    if isinstance(value, defaultdict):
+        return f"{name}({value.default_factory!r}, {{", "})", "mapping"
+    if isinstance(value, deque):
+        return f"{name}([", "])" if value.maxlen is None else f"], maxlen={value.maxlen})", "items"
+    if isinstance(value, OrderedDict) and sys.version_info < (3, 12):
+        return f"{name}([", "])", "pairs"  # 3.12 之前为 OrderedDict([(键, 值), ...])
+    if isinstance(value, Mapping):
+        return f"{name}({{", "})", "mapping"
+    if isinstance(value, (set, frozenset)):
+        return f"{name}({{", "})", "items"
+    return f"{name}([", "])", "items"
+
+
+def iter_repr(value: Any, _seen: Optional[set] = None, _depth: int = 0,
+              limits: Optional[reprlib.Repr] = None) -> Iterator[str]:
+    """
+    流式生成对象的 repr：内置容器及其子类、collections 中的常用容器逐个元素生成，
+    长字符串、字节串（含子类）与 array.array 分块生成，调用方可以随时停止，无需先格式化整个对象。
+    其他对象调用 repr；给出 limits 时按其上限截断（用于有显示预算的场合）。
+    """
+    kind = type(value)
+    if isinstance(value, (str, bytes, bytearray)) and kind.__repr__ in _TEXT_REPRS and len(value) > _CHUNK:
+        yield from _iter_text_repr(value)
+        return
+    if isinstance(value, array.array) and kind.__repr__ is array.array.__repr__:
+        yield from _iter_array_repr(value)
+        return
+    if isinstance(value, memoryview):
+        yield repr(value)  # <memory at 0x...>，不含内容，无需分块
+        return
+    layout = None if kind in _BRACKETS and not value else _layout(value)
+    if layout is None:
+        yield repr(value) if limits is None else limits.repr(value)
+        return
+    seen = _seen if _seen is not None else set()
+    if id(value) in seen or _depth >= _MAX_DEPTH:
+        yield "{...}" if layout[2] == "mapping" else "[...]" if isinstance(value, list) else "(...)"
+        return
+    seen.add(id(value))
+    opening, closing, form = layout
+    yield opening
+    for i, item in enumerate(value if form == "items" else value.items()):
+        if i:
+            yield ", "
+        if form == "mapping":
+            yield from iter_repr(item[0], seen, _depth + 1, limits)
+            yield ": "
+            item = item[1]
+        yield from iter_repr(item, seen, _depth + 1, limits)
+    if kind is tuple and len(value) == 1:
+        yield ","
+    yield closing
+    seen.discard(id(value))
+
+
+def page(value: Any) -> None:
+    """
+    将完整的 repr 流式写入分页器（$PAGER，默认 less），用户退出分页器后立即停止生成。
+    非终端或没有分页器时直接流式输出。
+    """
+    command = os.environ.get("PAGER") or ("less -R" if shutil.which("less") else "")
+    if not command or not sys.stdout.isatty():
+        for chunk in iter_repr(value):
+            sys.stdout.write(chunk)
+        sys.stdout.write("\n")
+        return
+    sys.stdout.flush()
+    process = subprocess.Popen(command, shell=True, stdin=subprocess.PIPE, encoding="utf-8", errors="replace")
+    try:
+        for chunk in iter_repr(value):
+            process.stdin.write(chunk)
+        process.stdin.write("\n")
+        process.stdin.close()
+    except (BrokenPipeError, OSError):
+        pass  # 用户提前退出了分页器
+    except KeyboardInterrupt:
+        process.terminate()
+    finally:
+        try:
+            process.wait()
+        except KeyboardInterrupt:
+            process.kill()
+
+
+class DisplayFormatter:
+    """
+    Out[n] 的显示层：在字符数与时间预算内按需生成 repr，超出时截断并给出摘要行，
+    完整内容可通过 %page 在分页器中查看。回显变量因此不会阻塞 Shell。
+    预算可通过环境变量 SINGLEPYTHON_DISPLAY_LIMIT（字符）与 SINGLEPYTHON_DISPLAY_TIME（秒）配置。
+    """
+
+    def __init__(self, max_chars: Optional[int] = None, time_budget: Optional[float] = None) -> None:
+        self.max_chars = max_chars or _env_number("SINGLEPYTHON_DISPLAY_LIMIT", DEFAULT_DISPLAY_LIMIT, int)
+        self.time_budget = time_budget or _env_number("SINGLEPYTHON_DISPLAY_TIME", DEFAULT_DISPLAY_TIME, float)
+        self._limits = _capped_repr(self.max_chars)
+
+    def format(self, value: Any) -> Tuple[str, bool]:
+        """
+        :return: (显示文本, 是否被截断)
+        """
+        deadline = time.perf_counter() + self.time_budget
+        parts, length = [], 0
+        for chunk in iter_repr(value, limits=self._limits):
+            parts.append(chunk)
+            length += len(chunk)
+            if length > self.max_chars or time.perf_counter() > deadline:
+                return "".join(parts)[:self.max_chars], True
+        return "".join(parts), False
+
+    @staticmethod
+    def summary(value: Any, shown: int) -> str:
+        try:
+            unit = ("characters" if isinstance(value, str)
+                    else "bytes" if isinstance(value, (bytes, bytearray)) else "items")
+            size = f" of {len(value):,} {unit}"
+        except Exception:
+            size = ""
+        return (f"... output truncated after {shown:,} characters "
+                f"({type(value).__name__}{size}); use %page to view it in full")
+
+    def show(self, value: Any, prefix: str = "") -> None:
+        text, truncated = self.format(value)
+        print(f"{prefix}{text}")
+        if truncated:
+            print(color_print(self.summary(value, len(text)), "yellow"))
@@ -0,0 +1,99 @@
+# highlight.py
+
+import os
+from typing import Callable, Dict, List, Tuple
+
+from prompt_toolkit.document import Document
+from prompt_toolkit.lexers import Lexer
+from prompt_toolkit.styles.pygments import pygments_token_to_classname
+from pygments.lexer import ExtendedRegexLexer, LexerContext
+from pygments.lexers import PythonLexer
+
+DEFAULT_HIGHLIGHT_LIMIT = 200_000  # 字符
+
+StyleAndTextTuples = List[Tuple[str, str]]
+
+
+def default_highlight_limit() -> int:
+    """
+    超过该字符数的输入不再高亮，可通过环境变量 SINGLEPYTHON_HIGHLIGHT_LIMIT 覆盖（0 表示不限制）。
+    """
+    try:
+        return int(os.environ.get("SINGLEPYTHON_HIGHLIGHT_LIMIT", DEFAULT_HIGHLIGHT_LIMIT))
+    except ValueError:
+        return DEFAULT_HIGHLIGHT_LIMIT
+
+
+class IncrementalPythonLexer(Lexer):
+    """
+    增量语法高亮：按行缓存 token 与行首的词法状态栈，输入变化时只从第一处改动的行开始重新分析，
+    直到某行的内容与行首状态都与缓存一致（状态已收敛），其后各行直接复用缓存。
+    每次按键的开销与改动范围相关，而不是与整个缓冲区的长度相关。
+    跨行的 docstring 按普通三引号字符串着色。
+    """
+
+    def __init__(self, max_size: int = None) -> None:
+        self.max_size = default_highlight_limit() if max_size is None else max_size
+        self._lexer = PythonLexer()
+        self._styles: Dict[object, str] = {}
+        self._lines: List[str] = []
+        self._states: List[Tuple[str, ...]] = [("root",)]  # 第 i 行行首的状态栈，比行数多一项
+        self._tokens: List[StyleAndTextTuples] = []
+
+    def _style(self, tokentype) -> str:
+        style = self._styles.get(tokentype)
+        if style is None:
+            style = self._styles[tokentype] = f"class:{pygments_token_to_classname(tokentype)}"
+        return style
+
+    def _lex_line(self, line: str, state: Tuple[str, ...]) -> Tuple[StyleAndTextTuples, Tuple[str, ...]]:
+        """
+        从给定状态栈开始分析一行，返回该行的 token 与行末状态栈。
+        """
+        context = LexerContext(line + "\n", 0, list(state))
+        # PythonLexer 是 RegexLexer，借用 ExtendedRegexLexer 的分析循环以便传入并取回状态栈
+        tokens = [(self._style(tokentype), text)
+                  for _, tokentype, text in ExtendedRegexLexer.get_tokens_unprocessed(self._lexer, context=context)]
+        if tokens:
+            style, text = tokens[-1]
+            tokens[-1] = (style, text[:-1]) if text.endswith("\n") else (style, text)
+        return tokens, tuple(context.stack)
+
+    def _update(self, lines: List[str]) -> None:
+        old_lines, old_states, old_tokens = self._lines, self._states, self._tokens
+        limit = min(len(old_lines), len(lines))
+        first = 0
+        while first < limit and old_lines[first] == lines[first]:
+            first += 1
+        if first == len(lines) == len(old_lines):
+            return
+        # 公共后缀中的行可在状态收敛后复用缓存（按行数差平移）
+        shift = len(old_lines) - len(lines)
+        suffix_start = len(lines)
+        while suffix_start > first and suffix_start + shift > first \
+                and old_lines[suffix_start - 1 + shift] == lines[suffix_start - 1]:
+            suffix_start -= 1
+        states = old_states[:first + 1]
+        tokens = old_tokens[:first]
+        for i in range(first, len(lines)):
+            if i >= suffix_start and states[i] == old_states[i + shift]:
+                tokens.extend(old_tokens[i + shift:])
+                states.extend(old_states[i + shift + 1:])
+                break
+            line_tokens, end_state = self._lex_line(lines[i], states[i])
+            tokens.append(line_tokens)
+            states.append(end_state)
+        self._lines, self._states, self._tokens = list(lines), states, tokens
+
+    def lex_document(self, document: Document) -> Callable[[int], StyleAndTextTuples]:
+        lines = document.lines
+        if self.max_size and len(document.text) > self.max_size:
+            # 超大输入不高亮，保持输入流畅
+            return lambda lineno: [("", lines[lineno])] if 0 <= lineno < len(lines) else []
+        self._update(lines)
+        tokens = self._tokens
+
+        def get_line(lineno: int) -> StyleAndTextTuples:
+            return tokens[lineno] if 0 <= lineno < len(tokens) else []
+
+        return get_line
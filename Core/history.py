@@ -0,0 +1,317 @@
+# history.py
+
+import contextlib
+import itertools
+import mmap
+import os
+import struct
+import threading
+from typing import Dict, Iterable, Iterator, Optional
+
+from prompt_toolkit.history import InMemoryHistory
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+_LOG_MAGIC = b"SPHIST1\n"
+_LEN = struct.Struct("<I")
+_OFFSET = struct.Struct("<Q")
+
+
+def default_history_path() -> str:
+    """
+    默认历史文件路径，可通过环境变量 SINGLEPYTHON_HISTORY 覆盖。
+    """
+    return os.environ.get("SINGLEPYTHON_HISTORY") or os.path.join(os.path.expanduser("~"), ".singlepython_history")
+
+
+class _RadixNode:
+    """
+    压缩前缀树节点：label 为父节点到本节点的边，best 为子树中最近的条目。
+    """
+    __slots__ = ("label", "children", "best", "best_seq", "terminal_seq")
+
+    def __init__(self, label: str = "") -> None:
+        self.label = label
+        self.children: Dict[str, "_RadixNode"] = {}
+        self.best: Optional[str] = None
+        self.best_seq = float("-inf")
+        self.terminal_seq = None  # 恰好在此结束的条目的序号
+
+    def offer(self, entry: str, seq) -> None:
+        if seq > self.best_seq:
+            self.best, self.best_seq = entry, seq
+
+
+class PrefixIndex:
+    """
+    历史记录前缀索引（压缩前缀树），每个节点缓存其子树中最近的条目。
+    插入为 O(len(entry))，查询为 O(len(prefix))，与历史条数无关。
+    """
+
+    def __init__(self) -> None:
+        self._root = _RadixNode()
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def insert(self, entry: str, seq) -> None:
+        """
+        插入条目；seq 越大表示越新，重复条目仅更新其序号。
+        """
+        if not entry:
+            return
+        node = self._root
+        node.offer(entry, seq)
+        i, n = 0, len(entry)
+        while i < n:
+            child = node.children.get(entry[i])
+            if child is None:
+                leaf = _RadixNode(entry[i:])
+                leaf.offer(entry, seq)
+                leaf.terminal_seq = seq
+                node.children[entry[i]] = leaf
+                self.size += 1
+                return
+            label = child.label
+            if entry.startswith(label, i):
+                j = len(label)
+            else:
+                j = 1
+                limit = min(len(label), n - i)
+                while j < limit and label[j] == entry[i + j]:
+                    j += 1
+                # 在公共前缀处拆分边
+                mid = _RadixNode(label[:j])
+                mid.best, mid.best_seq = child.best, child.best_seq
+                child.label = label[j:]
+                mid.children[child.label[0]] = child
+                node.children[entry[i]] = mid
+                child = mid
+            node = child
+            node.offer(entry, seq)
+            i += j
+        if node.terminal_seq is None:
+            self.size += 1
+            node.terminal_seq = seq
+        elif seq > node.terminal_seq:
+            node.terminal_seq = seq
+
+    def latest_with_prefix(self, prefix: str) -> Optional[str]:
+        """
+        返回以 prefix 开头且比 prefix 更长的最近条目，没有则返回 None。
+        """
+        node = self._root
+        i, n = 0, len(prefix)
+        while i < n:
+            child = node.children.get(prefix[i])
+            if child is None:
+                return None
+            label = child.label
+            if n - i < len(label):
+                # 前缀止于边的中间：该子树中的条目都比前缀更长
+                return child.best if label.startswith(prefix[i:]) else None
+            if not prefix.startswith(label, i):
+                return None
+            node = child
+            i += len(label)
+        if node.terminal_seq is not None and node.terminal_seq >= node.best_seq:
+            # 最近的条目就是前缀本身，改从子节点中找
+            best = max(node.children.values(), key=lambda c: c.best_seq, default=None)
+            return best.best if best is not None else None
+        return node.best
+
+
+class IndexedHistory(InMemoryHistory):
+    """
+    带前缀索引的内存历史记录，append_string 时增量更新索引，
+    供 BlockAutoSuggestFromHistory 快速查找建议。
+    """
+
+    def __init__(self, history_strings: Optional[Iterable[str]] = None) -> None:
+        super().__init__(history_strings)
+        self.prefix_index = PrefixIndex()
+        self._seq = 0
+
+    @staticmethod
+    def _index_key(string: str) -> str:
+        return string.rstrip("\n")
+
+    def load_history_strings(self) -> Iterable[str]:
+        # 预载条目从新到旧给出，使用负序号，保证晚于它们追加的条目更新
+        for i, string in enumerate(super().load_history_strings(), start=1):
+            self.prefix_index.insert(self._index_key(string), -i)
+            yield string
+
+    def append_string(self, string: str) -> None:
+        super().append_string(string)
+        self._seq += 1
+        self.prefix_index.insert(self._index_key(string), self._seq)
+
+    def suggest(self, text: str) -> Optional[str]:
+        """
+        返回以 text 开头的最近历史块的剩余部分。
+        """
+        if entry := self.prefix_index.latest_with_prefix(text):
+            return entry[len(text):]
+        return None
+
+    def last_string(self) -> Optional[str]:
+        """
+        最近一条历史，用于去重判断，无需复制整个历史。
+        """
+        return self._storage[-1] if self._storage else None
+
+
+class HistoryLog:
+    """
+    追加式历史日志：path 存放 [u32 长度][UTF-8 内容] 记录，path.idx 存放每条记录的 u64 偏移。
+    打开时对两者做只读内存映射，按需解码单条记录；追加时持有 path.lock 文件锁，
+    支持多个 shell 并发写入。
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        flags = os.O_RDWR | os.O_CREAT | os.O_APPEND | getattr(os, "O_BINARY", 0)
+        self._log_fd = os.open(path, flags, 0o600)
+        self._idx_fd = os.open(path + ".idx", flags, 0o600)
+        self._lock_fd = os.open(path + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+        self._log_map = self._idx_map = None
+        # 先取索引长度：索引中出现的偏移对应的记录一定已完整写入日志
+        idx_size = os.fstat(self._idx_fd).st_size // _OFFSET.size * _OFFSET.size
+        log_size = os.fstat(self._log_fd).st_size
+        self._count = idx_size // _OFFSET.size if log_size else 0
+        if self._count:
+            self._idx_map = mmap.mmap(self._idx_fd, idx_size, access=mmap.ACCESS_READ)
+            self._log_map = mmap.mmap(self._log_fd, log_size, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, i: int) -> str:
+        """
+        解码打开时快照中的第 i 条记录，损坏的记录返回空字符串。
+        """
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError("history index out of range")
+        (offset,) = _OFFSET.unpack_from(self._idx_map, i * _OFFSET.size)
+        end = offset + _LEN.size
+        if end > len(self._log_map):
+            return ""
+        (length,) = _LEN.unpack_from(self._log_map, offset)
+        if end + length > len(self._log_map):
+            return ""
+        return self._log_map[end:end + length].decode("utf-8", "surrogatepass")
+
+    def iter_reversed(self) -> Iterator[str]:
+        """
+        从新到旧逐条解码快照中的记录。
+        """
+        for i in range(self._count - 1, -1, -1):
+            if string := self[i]:
+                yield string
+
+    @contextlib.contextmanager
+    def _locked(self):
+        if os.name == "nt":
+            os.lseek(self._lock_fd, 0, os.SEEK_SET)
+            msvcrt.locking(self._lock_fd, msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                os.lseek(self._lock_fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._lock_fd, msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def append(self, string: str) -> None:
+        """
+        追加一条记录：先写日志再写偏移，崩溃时最多留下一条未被索引的记录。
+        """
+        data = string.encode("utf-8", "surrogatepass")
+        with self._locked():
+            log_size = os.fstat(self._log_fd).st_size
+            if log_size == 0:
+                os.write(self._log_fd, _LOG_MAGIC)
+                log_size = len(_LOG_MAGIC)
+            idx_size = os.fstat(self._idx_fd).st_size
+            if idx_size % _OFFSET.size:
+                # 丢弃上次中断写入留下的残缺偏移
+                os.ftruncate(self._idx_fd, idx_size - idx_size % _OFFSET.size)
+            os.write(self._log_fd, _LEN.pack(len(data)) + data)
+            os.write(self._idx_fd, _OFFSET.pack(log_size))
+
+    def close(self) -> None:
+        for mapped in (self._log_map, self._idx_map):
+            if mapped is not None:
+                mapped.close()
+        self._log_map = self._idx_map = None
+        self._count = 0
+        for fd in (self._log_fd, self._idx_fd, self._lock_fd):
+            with contextlib.suppress(OSError):
+                os.close(fd)
+
+
+class SharedFileHistory(IndexedHistory):
+    """
+    持久化、多 shell 共享的历史记录。
+    启动时只映射文件；上下键浏览只加载最近 load_limit 条，
+    全部历史的前缀索引在后台线程中构建，完成前仅用本次会话的条目给出建议。
+    """
+
+    def __init__(self, path: str, load_limit: Optional[int] = 10_000) -> None:
+        super().__init__()
+        self.log = HistoryLog(path)
+        self.load_limit = load_limit
+        self._session_strings: list[str] = []
+        self._persisted_index: Optional[PrefixIndex] = None
+        threading.Thread(target=self._build_persisted_index, name="history-index", daemon=True).start()
+
+    def _build_persisted_index(self) -> None:
+        index = PrefixIndex()
+        for i, string in enumerate(self.log.iter_reversed(), start=1):
+            index.insert(self._index_key(string), -i)
+        self._persisted_index = index
+
+    def load_history_strings(self) -> Iterable[str]:
+        yield from reversed(self._session_strings)
+        yield from itertools.islice(self.log.iter_reversed(), self.load_limit)
+
+    def store_string(self, string: str) -> None:
+        self._session_strings.append(string)
+        self.log.append(string)
+
+    def suggest(self, text: str) -> Optional[str]:
+        # 本次会话的条目总是比文件中已有的条目更新，优先查询
+        if (suggestion := super().suggest(text)) is not None:
+            return suggestion
+        if self._persisted_index is not None:
+            if entry := self._persisted_index.latest_with_prefix(text):
+                return entry[len(text):]
+        return None
+
+    def last_string(self) -> Optional[str]:
+        if self._session_strings:
+            return self._session_strings[-1]
+        return next(self.log.iter_reversed(), None)
+
+
+def open_history(path: Optional[str] = None) -> IndexedHistory:
+    """
+    打开持久化历史；未指定路径或文件不可用时退回内存历史。
+    """
+    if path:
+        try:
+            return SharedFileHistory(path)
+        except (OSError, ValueError):
+            pass
+    return IndexedHistory()
@@ -1,29 +1,244 @@
 # interpreter.py
 
+import ast
 import code
+import linecache
+import re
+from collections import OrderedDict
+
+MAX_CELLS = 200  # 保留源码供回溯显示的普通输入条数
+MAX_DEFINITION_CELLS = 2000  # 定义了函数/类的输入单独保留，供 inspect 与 %lprun 使用
+_DEFINITION = re.compile(r"(?:async\s+)?(?:def|class)\b")
+_DEFINES_CODE = re.compile(r"\b(?:def|class|lambda)\b")
+_OUTSIDE_STRING = re.compile(r"""[#'"()\[\]{}\\]""")
+_INSIDE_STRING = {quote: re.compile(r"\\(.|$)|" + re.escape(quote))
+                  for quote in ("'", '"', "'''", '"""')}
+
+
+class StatementTracker:
+    """
+    增量判断输入是否构成完整语句：每加入一行只扫描该行，维护括号深度、
+    未闭合的字符串、反斜杠续行以及复合语句（以冒号结尾的逻辑行、装饰器）的状态，
+    因此逐行输入或粘贴 n 行代码的总开销是线性的，最终只需编译一次。
+    """
+
+    def __init__(self, blank_line_ends_block: bool = True) -> None:
+        # 交互模式下空行结束复合语句；批处理模式中块内空行不结束语句
+        self.blank_line_ends_block = blank_line_ends_block
+        self.reset()
+
+    def reset(self) -> None:
+        self.lines: list[str] = []
+        self._depth = 0             # 未闭合的括号数
+        self._string = None         # 未闭合字符串的引号（' " ''' """）
+        self._continued = False     # 上一行以反斜杠续行
+        self._block = False         # 处于复合语句中
+        self._decorated = False     # 装饰器之后、def/class 之前
+        self._body = False          # 复合语句已有语句体
+        self._logical_line = ""     # 当前逻辑行的首个物理行
+
+    @property
+    def open(self) -> bool:
+        """
+        当前逻辑行尚未结束（括号、字符串或续行未闭合）。
+        """
+        return self._depth > 0 or self._string is not None or self._continued
+
+    @property
+    def in_block(self) -> bool:
+        return self._block or self._decorated
+
+    def can_close(self) -> bool:
+        """
+        缓冲区是一个已有语句体的复合语句，遇到下一条顶格语句时即可执行。
+        """
+        return self._block and self._body and not self.open
+
+    @property
+    def source(self) -> str:
+        return "\n".join(self.lines)
+
+    def _scan(self, line: str) -> str:
+        """
+        扫描一行，更新字符串与括号状态，返回该行在注释之前的代码部分。
+        """
+        pos, end = 0, len(line)
+        self._continued = False
+        while pos < end:
+            if self._string is not None:
+                match = _INSIDE_STRING[self._string].search(line, pos)
+                if match is None:
+                    break
+                pos = match.end()
+                if match.group(0).startswith("\\"):
+                    if match.end() == end and len(match.group(0)) == 1:
+                        return line  # 字符串内的反斜杠续行
+                    continue
+                self._string = None
+                continue
+            match = _OUTSIDE_STRING.search(line, pos)
+            if match is None:
+                break
+            char = match.group(0)
+            pos = match.end()
+            if char == "#":
+                return line[:match.start()]
+            if char in "([{":
+                self._depth += 1
+            elif char in ")]}":
+                self._depth = max(0, self._depth - 1)
+            elif char == "\\":
+                if line[pos:].strip() == "":
+                    self._continued = True
+                    return line[:match.start()]
+            elif line.startswith(char * 3, match.start()):
+                self._string = char * 3
+                pos = match.start() + 3
+            else:
+                self._string = char
+        if self._string in ("'", '"'):
+            self._string = None  # 单引号字符串不能跨行，交给编译器报告错误
+        return line
+
+    def feed(self, line: str) -> bool:
+        """
+        加入一行输入。
+        :return: True 表示缓冲区已构成完整语句，可以编译执行
+        """
+        new_logical_line = not self.open
+        self.lines.append(line)
+        stripped = line.strip()
+        if new_logical_line:
+            if not stripped:
+                if self.in_block:
+                    return self._block and self.blank_line_ends_block
+                return True
+            if stripped.startswith("@") and not self._block:
+                self._decorated = True
+            self._logical_line = stripped
+        code_part = self._scan(line).rstrip()
+        if self.open:
+            return False
+        if self._decorated and not code_part.endswith(":") and _DEFINITION.match(self._logical_line):
+            # 被装饰的 def/class 语句体写在同一行（如 def f(): pass），语句已完整
+            self._decorated = False
+            return True
+        if code_part.endswith(":"):
+            self._body = self._block and self._body
+            self._block, self._decorated = True, False
+            return False
+        if self._block:
+            if code_part.strip():
+                self._body = True
+            return False
+        return not self._decorated and not self._block
+
 
 class MyInteractiveInterpreter(code.InteractiveInterpreter):
     """
     扩展的交互式解释器，支持多行缓冲输入。
     """
 
-    def __init__(self) -> None:
+    def __init__(self, blank_line_ends_block: bool = True) -> None:
         super().__init__()
-        self.buffer: list[str] = []
+        self.tracker = StatementTracker(blank_line_ends_block)
+        self.error_count = 0  # 已报告的异常数，供批处理/服务端判断执行结果
+        self.cell_count = 0
+        self._cells: "OrderedDict[str, None]" = OrderedDict()
+        self._definition_cells: "OrderedDict[str, None]" = OrderedDict()
+
+    def register_cell(self, source: str, filename: str = "<input>") -> str:
+        """
+        将一段输入登记到 linecache，返回唯一的伪文件名（如 <input-3>），
+        使回溯、inspect 和 %lprun 能显示交互中定义的代码。只保留最近的若干条。
+        """
+        self.cell_count += 1
+        if filename.startswith("<") and filename.endswith(">"):
+            filename = f"{filename[:-1]}-{self.cell_count}>"
+        lines = source.splitlines(keepends=True)
+        if lines and not lines[-1].endswith("\n"):
+            lines[-1] += "\n"
+        linecache.cache[filename] = (len(source), None, lines, filename)
+        # 分别按条数上限淘汰最早的输入，长时间运行的批处理/服务端不会让 linecache 无限增长
+        if _DEFINES_CODE.search(source):
+            cells, limit = self._definition_cells, MAX_DEFINITION_CELLS
+        else:
+            cells, limit = self._cells, MAX_CELLS
+        cells[filename] = None
+        cells.move_to_end(filename)
+        while len(cells) > limit:
+            linecache.cache.pop(cells.popitem(last=False)[0], None)
+        return filename
+
+    def compile_cell(self, source: str, filename: str = "<input>", symbol: str = "exec"):
+        """
+        登记并编译一段输入。
+        """
+        return compile(source, self.register_cell(source, filename), symbol)
+
+    def compile_interactive(self, source: str, filename: str = "<input>") -> list:
+        """
+        登记并编译一段交互输入。最后一条语句是表达式时单独以 "single" 模式编译，
+        执行时其值交给 sys.displayhook（由 Shell 显示并写入输出缓存）。
+        :return: 依次执行的代码对象列表
+        """
+        filename = self.register_cell(source, filename)
+        tree = compile(source, filename, "exec", ast.PyCF_ONLY_AST)
+        if tree.body and isinstance(tree.body[-1], ast.Expr):
+            last = ast.Interactive(body=[tree.body.pop()])
+            return [compile(tree, filename, "exec"), compile(last, filename, "single")]
+        return [compile(tree, filename, "exec")]
+
+    def run_codes(self, codes: list) -> bool:
+        """
+        依次执行代码对象，出现异常时停止。
+        :return: 是否全部执行成功
+        """
+        errors = self.error_count
+        for codes_item in codes:
+            self.runcode(codes_item)
+            if self.error_count != errors:
+                return False
+        return True
+
+    def showtraceback(self) -> None:
+        self.error_count += 1
+        super().showtraceback()
+
+    def showsyntaxerror(self, filename=None, **kwargs) -> None:
+        self.error_count += 1
+        super().showsyntaxerror(filename, **kwargs)
+
+    @property
+    def buffer(self) -> list[str]:
+        return self.tracker.lines
+
+    def run_pending(self, filename: str = "<input>", symbol: str = "exec") -> None:
+        """
+        编译并执行缓冲区中的全部代码（只编译一次），不完整时报告语法错误。
+        """
+        source = self.tracker.source
+        self.tracker.reset()
+        filename = self.register_cell(source, filename)
+        try:
+            codes = compile(source, filename, symbol)
+        except (OverflowError, SyntaxError, ValueError):
+            self.showsyntaxerror(filename)
+            return
+        self.runcode(codes)
 
     def runsource(
         self, source: str, filename: str = "<input>", symbol: str = "exec"
     ) -> bool:
         """
-        支持多行输入的代码缓冲与执行。
+        支持多行输入的代码缓冲与执行。由 StatementTracker 逐行判断语句是否完整，
+        不再在每行输入后重新编译整个缓冲区。
         :param source: 当前输入的代码行
         :param filename: 源文件名
         :param symbol: 执行类型
         :return: True 表示需要继续输入，False 表示已执行
         """
-        self.buffer.append(source)
-        source_joined = "\n".join(self.buffer)
-        if code.compile_command(source_joined) is not None:
-            self.buffer = []
-            return super().runsource(source_joined, filename, symbol)
-        return True
\ No newline at end of file
+        if not self.tracker.feed(source):
+            return True
+        self.run_pending(filename, symbol)
+        return False
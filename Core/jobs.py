@@ -0,0 +1,128 @@
+# jobs.py
+
+import ctypes
+import threading
+import time
+import traceback
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from Core.magic_commands import TimeFormatter
+from Core.utils import color_print
+
+
+class JobKilled(Exception):
+    """
+    由 %kill 注入到后台线程中的异常。
+    """
+
+
+@dataclass
+class Job:
+    id: int
+    source: str
+    thread: Optional[threading.Thread] = None
+    status: str = "running"  # running / done / error / killed
+    started: float = field(default_factory=time.perf_counter)
+    finished: Optional[float] = None
+    error: Optional[str] = None
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.perf_counter()) - self.started
+
+    def summary(self, width: int = 40, status: Optional[str] = None) -> str:
+        source = " ".join(self.source.split())
+        if len(source) > width:
+            source = source[:width - 3] + "..."
+        return f"[{self.id}] {status or self.status} {TimeFormatter.format_time(self.elapsed)}: {source}"
+
+
+class JobManager:
+    """
+    后台作业表：在工作线程中针对共享命名空间执行代码，前台提示符保持可用。
+    """
+
+    def __init__(self, interpreter) -> None:
+        self.interpreter = interpreter
+        self.jobs: Dict[int, Job] = {}
+        self._next_id = 1
+
+    def submit(self, source: str) -> Job:
+        """
+        编译并在后台线程中启动作业；语法错误在前台直接抛出。
+        """
+        job_id = self._next_id
+        codes = self.interpreter.compile_cell(source, f"<bg-{job_id}>")
+        self._next_id += 1
+        job = Job(job_id, source)
+        job.thread = threading.Thread(target=self._run, args=(job, codes), name=f"bg-{job_id}", daemon=True)
+        self.jobs[job_id] = job
+        print(color_print(f"[{job_id}] started", "cyan"))
+        job.thread.start()
+        return job
+
+    def _run(self, job: Job, codes) -> None:
+        status = "error"
+        try:
+            exec(codes, self.interpreter.locals)
+            status = "done"
+        except JobKilled:
+            status = "killed"
+        except BaseException as e:
+            # 去掉 _run 自身所在的栈帧
+            job.error = "".join(traceback.format_exception(type(e), e, e.__traceback__.tb_next))
+        finally:
+            job.finished = time.perf_counter()
+        color = {"done": "green", "killed": "yellow"}.get(status, "red")
+        print(color_print(job.summary(status=status), color))
+        if job.error:
+            print(job.error, end="")
+        # 输出全部写完后才更新状态：wait_all 与提示符依据状态判断作业是否结束
+        job.status = status
+
+    def get(self, job_id: int) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def running(self) -> List[Job]:
+        return [job for job in self.jobs.values() if job.status == "running"]
+
+    def wait(self, job: Job, timeout: Optional[float] = None) -> bool:
+        """
+        等待作业结束，返回作业是否已结束。以短超时轮询，便于 Ctrl+C 中断等待。
+        """
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while job.thread.is_alive():
+            remaining = None if deadline is None else deadline - time.perf_counter()
+            if remaining is not None and remaining <= 0:
+                return False
+            job.thread.join(0.1 if remaining is None else min(0.1, remaining))
+        return True
+
+    def wait_all(self) -> None:
+        for job in list(self.jobs.values()):
+            if job.thread.is_alive():
+                self.wait(job)
+
+    @staticmethod
+    def kill(job: Job) -> bool:
+        """
+        向作业线程注入 JobKilled；线程阻塞在 C 调用中时，需等其返回 Python 代码后才会生效。
+        """
+        if not job.thread.is_alive():
+            return False
+        affected = ctypes.pythonapi.PyThreadState_SetAsyncExc(
+            ctypes.c_ulong(job.thread.ident), ctypes.py_object(JobKilled))
+        if affected > 1:
+            # 不应发生：撤销注入，避免影响其他线程
+            ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(job.thread.ident), None)
+            return False
+        return affected == 1
+
+    def toolbar(self) -> str:
+        """
+        提示符底部状态栏：显示运行中作业及其耗时。
+        """
+        if running := self.running():
+            return "  ".join(job.summary(width=24) for job in running)
+        return "no running jobs"
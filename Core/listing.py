@@ -0,0 +1,109 @@
+# listing.py
+
+import fnmatch
+import itertools
+import os
+import time
+from collections import OrderedDict
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+CACHE_TTL = 30.0  # 目录列表缓存的有效期（秒）
+CACHE_MAX_ENTRIES = 100_000  # 超过该条目数的目录不缓存
+CACHE_MAX_DIRS = 16
+SORT_LIMIT = 10_000  # 超过该条目数时不再排序，改为边扫描边输出
+
+
+class ListEntry(NamedTuple):
+    name: str
+    is_dir: bool
+    stat: Optional[os.stat_result]
+
+
+class DirectoryLister:
+    """
+    基于 os.scandir 的目录列举：直接使用 DirEntry 自带的类型信息，只在需要 -l 时才 stat。
+    完整扫描过的目录按 (路径, 目录 mtime) 短期缓存，目录有变化或超过有效期后重新扫描。
+    """
+
+    def __init__(self) -> None:
+        # 路径 -> (目录 mtime_ns, 缓存时间, 条目列表)
+        self._cache: "OrderedDict[str, Tuple[int, float, List[ListEntry]]]" = OrderedDict()
+
+    def _cached(self, path: str, mtime: int, need_stat: bool) -> Optional[List[ListEntry]]:
+        cached = self._cache.get(path)
+        if cached is None:
+            return None
+        cached_mtime, created, entries = cached
+        if cached_mtime != mtime or time.monotonic() - created > CACHE_TTL:
+            del self._cache[path]
+            return None
+        if need_stat and entries and entries[0].stat is None:
+            return None
+        self._cache.move_to_end(path)
+        return entries
+
+    def _store(self, path: str, mtime: int, entries: List[ListEntry]) -> None:
+        self._cache[path] = (mtime, time.monotonic(), entries)
+        self._cache.move_to_end(path)
+        while len(self._cache) > CACHE_MAX_DIRS:
+            self._cache.popitem(last=False)
+
+    def scan(self, path: str, need_stat: bool = False) -> Iterator[ListEntry]:
+        """
+        逐条产出目录条目；完整遍历后才写入缓存，中途停止（如 --limit）不影响结果。
+        """
+        path = os.path.abspath(path)
+        mtime = os.stat(path).st_mtime_ns
+        if (cached := self._cached(path, mtime, need_stat)) is not None:
+            yield from cached
+            return
+        collected: Optional[List[ListEntry]] = []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir()
+                    stat = entry.stat(follow_symlinks=False) if need_stat else None
+                except OSError:
+                    continue  # 扫描期间被删除
+                item = ListEntry(entry.name, is_dir, stat)
+                if collected is not None:
+                    collected.append(item)
+                    if len(collected) > CACHE_MAX_ENTRIES:
+                        collected = None
+                yield item
+        if collected is not None:
+            self._store(path, mtime, collected)
+
+    def list(self, path: str, patterns: Iterable[str] = (), need_stat: bool = False,
+             limit: Optional[int] = None) -> Iterator[Tuple[ListEntry, bool]]:
+        """
+        按 glob 过滤并产出 (条目, 是否已排序)。条目数不超过 SORT_LIMIT 时按目录优先、名称排序，
+        否则先输出已缓冲的部分，其余边扫描边输出，不等待整个目录扫描完。
+        指定 limit 时不缓冲，按目录顺序边扫描边输出，取满即停止扫描。
+        """
+        patterns = list(patterns)
+        matched = (entry for entry in self.scan(path, need_stat)
+                   if not patterns or any(fnmatch.fnmatch(entry.name, p) for p in patterns))
+        count = 0
+        buffered: List[ListEntry] = []
+        try:
+            if limit is not None:
+                for entry in itertools.islice(matched, limit):
+                    yield entry, False
+                return
+            for entry in matched:
+                buffered.append(entry)
+                if len(buffered) > SORT_LIMIT:
+                    break
+            else:
+                buffered.sort(key=lambda e: (not e.is_dir, e.name.startswith("."), e.name.lower()))
+                for entry in buffered[:limit]:
+                    yield entry, True
+                return
+            for entry in itertools.chain(buffered, matched):
+                if limit is not None and count >= limit:
+                    return
+                count += 1
+                yield entry, False
+        finally:
+            matched.close()  # 提前结束时及时关闭 scandir
@@ -1,17 +1,29 @@
 # magic_commands.py
 
 import io
+import json
+import linecache
 import math
+import os
 import re
+import reprlib
+import statistics
 import sys
 import time
+import cProfile
 import difflib
+import gc
+import pstats
+import tracemalloc
 from contextlib import redirect_stdout, redirect_stderr
 from timeit import Timer
-from typing import Any, Dict, Callable
+from typing import Any, Dict, Callable, List, Optional, Tuple
 from dataclasses import dataclass
-from tqdm import tqdm
 
+from Core.checkpoint import CheckpointReport, NamespaceCheckpoint, default_checkpoint_dir
+from Core.listing import DirectoryLister
+from Core.profiling import LineProfiler, SamplingProfiler
+from Core.sizing import deep_sizeof
 from Core.utils import color_print
 
 class TimeFormatter:
@@ -74,12 +86,181 @@ class TimeFormatter:
         scaling = [1, 1e3, 1e6, 1e9]
 
         if timespan > 0.0:
-            order = min(max(int(-math.log10(timespan) // 3), 0), 3)
+            order = min(max(-(math.floor(math.log10(timespan)) // 3), 0), 3)
         else:
             order = 3
         value = timespan * scaling[order]
         return f"{value:.{precision}g} {units[order]}"
 
+def format_bytes(size: float, signed: bool = False) -> str:
+    """
+    字节数格式化为 B/KB/MB/GB/TB。
+    """
+    sign = "-" if size < 0 else ("+" if signed else "")
+    size = abs(size)
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{sign}{size:.0f} {unit}" if unit == "B" else f"{sign}{size:.1f} {unit}"
+        size /= 1024
+    return f"{sign}{size:.1f} TB"
+
+
+def peak_rss() -> Optional[int]:
+    """
+    进程的峰值常驻内存（字节），不支持的平台返回 None。
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class GcTimer:
+    """
+    通过 gc.callbacks 统计代码块执行期间的垃圾回收次数与停顿时间。
+    """
+
+    def __init__(self) -> None:
+        self.collections = 0
+        self.elapsed = 0.0
+        self._start = None
+
+    def _callback(self, phase: str, info: dict) -> None:
+        if phase == "start":
+            self._start = time.perf_counter()
+        elif self._start is not None:
+            self.elapsed += time.perf_counter() - self._start
+            self.collections += 1
+            self._start = None
+
+    def __enter__(self) -> "GcTimer":
+        gc.callbacks.append(self._callback)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        gc.callbacks.remove(self._callback)
+
+
+TIMEIT_TARGET = 0.2  # %timeit 自动校准时每轮的目标耗时（秒）
+
+
+@dataclass
+class TimeitResult:
+    """
+    %timeit 的结果对象，timings 为每轮的单次循环耗时（秒）。
+    """
+    stmt: str
+    loops: int
+    repeat: int
+    timings: List[float]
+
+    @property
+    def best(self) -> float:
+        return min(self.timings)
+
+    @property
+    def worst(self) -> float:
+        return max(self.timings)
+
+    @property
+    def average(self) -> float:
+        return statistics.fmean(self.timings)
+
+    @property
+    def stdev(self) -> float:
+        return statistics.stdev(self.timings) if len(self.timings) > 1 else 0.0
+
+    @property
+    def median(self) -> float:
+        return statistics.median(self.timings)
+
+    def percentile(self, p: float) -> float:
+        """
+        线性插值计算百分位数，p 取 0-100。
+        """
+        ordered = sorted(self.timings)
+        k = (len(ordered) - 1) * p / 100
+        lo = math.floor(k)
+        hi = min(lo + 1, len(ordered) - 1)
+        return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "stmt": self.stmt, "loops": self.loops, "repeat": self.repeat, "timings": self.timings,
+            "mean": self.average, "stdev": self.stdev, "median": self.median,
+            "min": self.best, "max": self.worst,
+            "p5": self.percentile(5), "p95": self.percentile(95),
+        }
+
+    def __str__(self) -> str:
+        fmt = TimeFormatter.format_time
+        runs = "run" if self.repeat == 1 else "runs"
+        loops = "loop" if self.loops == 1 else "loops"
+        return (f"{fmt(self.average)} ± {fmt(self.stdev)} per loop "
+                f"(mean ± std. dev. of {self.repeat} {runs}, {self.loops:,} {loops} each)\n"
+                f"median {fmt(self.median)}, min {fmt(self.best)}, max {fmt(self.worst)}, "
+                f"p5 {fmt(self.percentile(5))}, p95 {fmt(self.percentile(95))}")
+
+    def __repr__(self) -> str:
+        return f"<TimeitResult : {self.__str__().splitlines()[0]}>"
+
+
+WHOS_TIME_BUDGET = 0.05  # %whos 为单个变量计算深度大小的时间预算（秒）
+
+
+class _WhosRepr(reprlib.Repr):
+    """
+    reprlib 对 bytes/bytearray 没有专门处理，会生成完整的 repr；这里先切片再 repr。
+    """
+
+    def repr_bytes(self, x, level):
+        text = repr(x[:self.maxstring])
+        return text if len(x) <= self.maxstring else text[:-1] + "..." + text[-1]
+
+    def repr_bytearray(self, x, level):
+        text = repr(bytes(x[:self.maxstring]))
+        return f"bytearray({text if len(x) <= self.maxstring else text[:-1] + '...' + text[-1]})"
+
+
+_whos_repr = _WhosRepr()
+_whos_repr.maxstring = _whos_repr.maxother = 80
+
+
+@dataclass
+class VariableInfo:
+    """
+    %whos 中一个变量的描述，每次显示时重新生成（均为常数时间的操作）。
+    """
+    type_name: str
+    length: str
+    size: Optional[int]
+    value: str
+
+    @classmethod
+    def describe(cls, value: Any) -> "VariableInfo":
+        shape = getattr(value, "shape", None) if not isinstance(value, type) else None
+        if isinstance(shape, tuple):
+            length = "x".join(map(str, shape)) or "()"
+            if (dtype := getattr(value, "dtype", None)) is not None:
+                length += f" {dtype}"
+        else:
+            try:
+                length = str(len(value))
+            except Exception:
+                length = ""
+        try:
+            size = sys.getsizeof(value)
+        except Exception:
+            size = None
+        try:
+            text = _whos_repr.repr(value)
+        except Exception as e:
+            text = f"<repr failed: {type(e).__name__}>"
+        return cls(type(value).__name__, length, size, " ".join(text.split()))
+
+
 # --------- 魔法命令自动注册机制 ---------
 @dataclass(frozen=True)
 class MagicCommand:
@@ -97,9 +278,14 @@ def magic_command(name):
     return decorator
 
 class MagicCommandHandler:
-    __slots__ = ("shell",)
+    __slots__ = ("shell", "_mem_snapshots", "_whos_cache", "_lister", "_checkpoint")
     def __init__(self, shell):
         self.shell = shell
+        self._mem_snapshots: List[tracemalloc.Snapshot] = []
+        # 变量名 -> (id, 类型, 长度, 深度大小)：只缓存代价高的深度大小
+        self._whos_cache: Dict[str, Tuple[int, type, Optional[int], Tuple[int, bool]]] = {}
+        self._lister = DirectoryLister()
+        self._checkpoint: Optional[NamespaceCheckpoint] = None  # 首次使用 %save_ns/%load_ns 时创建
 
     def handle_magic_command(self, text):
         """解析并分发魔法命令，支持模糊匹配建议，正则解析参数"""
@@ -109,7 +295,14 @@ class MagicCommandHandler:
             return
         cmd, arg = match[1], match[2] or ""
         if magic := MAGIC_COMMANDS.get(cmd):
-            return magic.func(self, arg)
+            result = magic.func(self, arg)
+            if result is not None:
+                # 与表达式结果一致，魔法命令的返回值绑定到 _（交互模式下经由输出缓存轮换 _、__、___）
+                if (cache := getattr(self.shell, "output_cache", None)) is not None:
+                    cache.rotate(result)
+                else:
+                    self.shell.interpreter.locals["_"] = result
+            return result
         if close := difflib.get_close_matches(cmd, MAGIC_COMMANDS.keys(), n=1):
             print(color_print(f"Unknown magic command: {cmd}. Did you mean {close[0]}?", 'yellow'))
         else:
@@ -121,62 +314,354 @@ class MagicCommandHandler:
     @magic_command("%time")
     def handle_time_command(self, code_to_time: str) -> None:
         """
-        计时执行代码块。
+        计时执行代码块，报告墙钟/CPU 时间、GC 停顿与内存峰值（-m 启用 tracemalloc）。
         """
-        if not code_to_time:
-            print(f"{color_print('Usage:', 'yellow')} %time <python_code>")
+        trace_memory = False
+        if match := re.match(r"^-m(?:\s+|$)(.*)$", code_to_time.strip(), re.S):
+            trace_memory, code_to_time = True, match[1]
+        if not code_to_time.strip():
+            print(f"{color_print('Usage:', 'yellow')} %time [-m] <python_code>")
             return
-        self.execute_timed_code(code_to_time)
+        self.execute_timed_code(code_to_time, trace_memory)
 
-    def execute_timed_code(self, code_to_time: str = None) -> None:
+    def execute_timed_code(self, code_to_time: str = None, trace_memory: bool = False) -> None:
         """
-        实际执行计时代码，抑制所有输出。
+        实际执行计时代码，保留代码自身的输出；单条表达式会像交互模式一样显示结果。
         """
-        local_vars = self.shell.interpreter.locals
-        def run():
-            with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
-                exec(code_to_time, local_vars)
-        timer = Timer(run)
-        start = time.perf_counter()
+        filename = self.shell.interpreter.register_cell(code_to_time)
         try:
-            timer.timeit(number=1)
-        except Exception as e:
+            try:
+                compiled = compile(code_to_time, filename, "single")
+            except SyntaxError:
+                compiled = compile(code_to_time, filename, "exec")
+        except (SyntaxError, ValueError, OverflowError) as e:
             print(color_print(f"Exception: {e}", "red"))
             return
-        end = time.perf_counter()
-        elapsed = end - start
-        print(f"Elapsed time: {TimeFormatter.format_time(elapsed)}")
+
+        started_tracing = trace_memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        if trace_memory:
+            tracemalloc.reset_peak()
+            traced_before = tracemalloc.get_traced_memory()[0]
+        rss_before = peak_rss()
+        with GcTimer() as gc_timer:
+            cpu_before = os.times()
+            wall_start = time.perf_counter()
+            self.shell.interpreter.runcode(compiled)
+            wall = time.perf_counter() - wall_start
+            cpu_after = os.times()
+        if trace_memory:
+            traced_after, traced_peak = tracemalloc.get_traced_memory()
+            if started_tracing:
+                tracemalloc.stop()
+        rss_after = peak_rss()
+
+        fmt = TimeFormatter.format_time
+        user = cpu_after.user - cpu_before.user
+        system = cpu_after.system - cpu_before.system
+        print(f"CPU times: user {fmt(user)}, sys {fmt(system)}, total {fmt(user + system)}")
+        print(f"Wall time: {fmt(wall)}")
+        if gc_timer.collections:
+            print(f"GC: {gc_timer.collections} collections, {fmt(gc_timer.elapsed)} paused")
+        memory = []
+        if rss_after is not None:
+            memory.append(f"peak RSS {format_bytes(rss_after)} (+{format_bytes(rss_after - rss_before)})")
+        if trace_memory:
+            memory.append(f"traced net {format_bytes(traced_after - traced_before, signed=True)}, "
+                          f"peak {format_bytes(traced_peak - traced_before)}")
+        if memory:
+            print(f"Memory: {'; '.join(memory)}")
 
     @magic_command("%timeit")
-    def handle_timeit_command(self, code_to_time: str) -> None:
+    def handle_timeit_command(self, code_to_time: str):
         """
-        多次计时执行代码块，统计最佳/平均/最差。
+        多次计时执行代码块，自动校准循环次数并输出统计信息。
         """
-        if not code_to_time:
-            print(f"{color_print('Usage:', 'yellow')} %timeit <python_code>")
+        usage = "%timeit [-n <loops>] [-r <repeats>] [-q] [-o] [--json] <python_code>"
+        options = {"-n": None, "-r": "7"}
+        flags = set()
+        while match := re.match(r"^(?:(-[nr])\s*(\d+)|(-[qo]|--json))(?:\s+|$)(.*)$", code_to_time.strip(), re.S):
+            if match[1]:
+                options[match[1]] = match[2]
+            else:
+                flags.add(match[3])
+            code_to_time = match[4]
+        if not code_to_time.strip():
+            print(f"{color_print('Usage:', 'yellow')} {usage}")
+            return None
+        n = int(options["-n"]) if options["-n"] else None
+        r = max(int(options["-r"]), 1)
+        result = self.execute_timeit_code(n, r, code_to_time)
+        if result is None:
+            return None
+        if "--json" in flags:
+            print(json.dumps(result.to_dict()))
+        elif "-q" not in flags:
+            print(result)
+            if result.worst > result.best * 4 and result.worst > 1e-6:
+                print(color_print(f"The slowest run took {result.worst / result.best:.2f} times longer than "
+                                  f"the fastest. This could mean that an intermediate result is being cached.",
+                                  "yellow"))
+        return result if "-o" in flags else None
+
+    def execute_timeit_code(self, n: Optional[int], r: int, code_to_time: str = None) -> Optional["TimeitResult"]:
+        """
+        实际执行多次计时代码：语句只编译一次，输出重定向在计时区之外完成；
+        未指定 n 时自动校准，使每轮耗时不少于 TIMEIT_TARGET 秒。
+        """
+        try:
+            timer = Timer(stmt=code_to_time, globals=self.shell.interpreter.locals)
+        except (SyntaxError, ValueError) as e:
+            print(color_print(f"Exception: {e}", "red"))
+            return None
+        try:
+            with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+                if n is None:
+                    n = self._calibrate_loops(timer)
+                times = timer.repeat(repeat=r, number=n)
+        except Exception as e:
+            print(color_print(f"Exception: {e}", "red"))
+            return None
+        return TimeitResult(code_to_time, n, r, [t / n for t in times])
+
+    @staticmethod
+    def _calibrate_loops(timer: Timer) -> int:
+        """
+        按 1, 2, 5, 10, 20, 50... 递增循环次数，直到单轮耗时达到 TIMEIT_TARGET。
+        """
+        scale = 1
+        while True:
+            for step in (1, 2, 5):
+                number = scale * step
+                if timer.timeit(number) >= TIMEIT_TARGET:
+                    return number
+            scale *= 10
+
+    @magic_command("%prun")
+    def handle_prun_command(self, arg: str = "") -> None:
+        """
+        用 cProfile 分析代码：%prun [-s 排序键] [-l 行数] [-D 文件] <python_code>
+        """
+        usage = "%prun [-s sortkey] [-l limit] [-D file.prof] <python_code>"
+        sort_keys, limit, dump_file = [], 20, None
+        while match := re.match(r"^(-[slD])\s+(\S+)\s*(.*)$", arg.strip(), re.S):
+            option, value, arg = match[1], match[2], match[3]
+            if option == "-s":
+                sort_keys.append(value)
+            elif option == "-l":
+                try:
+                    limit = float(value) if "." in value else int(value)
+                except ValueError:
+                    print(f"{color_print('Usage:', 'yellow')} {usage}")
+                    return
+            else:
+                dump_file = value
+        if not arg.strip():
+            print(f"{color_print('Usage:', 'yellow')} {usage}")
+            return
+        valid_keys = {key.value for key in pstats.SortKey} | {"time", "cumtime", "tottime", "ncalls"}
+        if invalid := [key for key in sort_keys if key not in valid_keys]:
+            print(color_print(f"Invalid sort key: {', '.join(invalid)}. "
+                              f"Choose from: {', '.join(sorted(valid_keys))}", "red"))
+            return
+        try:
+            compiled = self.shell.interpreter.compile_cell(arg)
+        except (SyntaxError, ValueError, OverflowError) as e:
+            print(color_print(f"Exception: {e}", "red"))
             return
-        self.execute_timeit_code(5, 3, code_to_time)
 
-    def execute_timeit_code(self, n: int, r: int, code_to_time: str = None) -> None:
+        local_vars = self.shell.interpreter.locals
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            exec(compiled, local_vars)
+        except SystemExit:
+            raise
+        except BaseException:
+            # 异常时仍输出已采集的数据
+            profiler.disable()
+            self.shell.interpreter.showtraceback()
+        finally:
+            profiler.disable()
+        stats = pstats.Stats(profiler, stream=sys.stdout)
+        stats.strip_dirs().sort_stats(*(sort_keys or ["cumulative"])).print_stats(limit)
+        if dump_file:
+            try:
+                profiler.dump_stats(dump_file)
+            except OSError as e:
+                print(color_print(f"Could not write {dump_file}: {e}", "red"))
+            else:
+                print(f"*** Profile stats written to {dump_file}")
+
+    @magic_command("%lprun")
+    def handle_lprun_command(self, arg: str = "") -> None:
         """
-        实际执行多次计时代码，抑制所有输出。
+        逐行分析指定函数：%lprun -f func [-f func2 ...] <python_code>
         """
+        usage = "%lprun -f <func> [-f <func> ...] <python_code>"
+        func_names = []
+        while match := re.match(r"^-f\s+(\S+)\s*(.*)$", arg.strip(), re.S):
+            func_names.append(match[1])
+            arg = match[2]
+        if not func_names or not arg.strip():
+            print(f"{color_print('Usage:', 'yellow')} {usage}")
+            return
         local_vars = self.shell.interpreter.locals
-        def run():
-            with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
-                exec(code_to_time, local_vars)
-        timer = Timer(run)
         try:
-            times = timer.repeat(repeat=r, number=n)
+            profiler = LineProfiler(eval(name, local_vars) for name in func_names)
+            compiled = self.shell.interpreter.compile_cell(arg)
         except Exception as e:
             print(color_print(f"Exception: {e}", "red"))
             return
-        best = min(times) / n
-        worst = max(times) / n
-        avg = sum(times) / (n * r)
-        print(f"Best: {TimeFormatter.format_time(best)}; "
-              f"Avg: {TimeFormatter.format_time(avg)}; "
-              f"Worst: {TimeFormatter.format_time(worst)}")
+        try:
+            with profiler:
+                exec(compiled, local_vars)
+        except SystemExit:
+            raise
+        except BaseException:
+            self.shell.interpreter.showtraceback()
+        print(profiler.format_stats())
+
+    @magic_command("%sample")
+    def handle_sample_command(self, arg: str = "") -> None:
+        """
+        低开销采样分析：%sample [--hz N] [-l 行数] [-o 折叠栈文件] <python_code>
+        """
+        usage = "%sample [--hz N] [-l limit] [-o file.folded] <python_code>"
+        options = {"--hz": "100", "-l": "15", "-o": None}
+        while match := re.match(r"^(--hz|-l|-o)\s+(\S+)\s*(.*)$", arg.strip(), re.S):
+            options[match[1]], arg = match[2], match[3]
+        try:
+            hz, limit = float(options["--hz"]), int(options["-l"])
+            if hz <= 0:
+                raise ValueError
+        except ValueError:
+            print(f"{color_print('Usage:', 'yellow')} {usage}")
+            return
+        if not arg.strip():
+            print(f"{color_print('Usage:', 'yellow')} {usage}")
+            return
+        try:
+            compiled = self.shell.interpreter.compile_cell(arg)
+        except (SyntaxError, ValueError, OverflowError) as e:
+            print(color_print(f"Exception: {e}", "red"))
+            return
+        profiler = SamplingProfiler(hz)
+        try:
+            with profiler:
+                exec(compiled, self.shell.interpreter.locals)
+        except SystemExit:
+            raise
+        except BaseException:
+            self.shell.interpreter.showtraceback()
+        print(profiler.format_summary(limit))
+        if options["-o"]:
+            try:
+                profiler.write_collapsed(options["-o"])
+            except OSError as e:
+                print(color_print(f"Could not write {options['-o']}: {e}", "red"))
+            else:
+                print(f"*** Collapsed stacks written to {options['-o']}")
+
+    @magic_command("%memit")
+    def handle_memit_command(self, code_to_run: str) -> None:
+        """
+        测量代码的内存峰值与净增量（tracemalloc），并给出进程峰值 RSS 的变化。
+        """
+        if not code_to_run.strip():
+            print(f"{color_print('Usage:', 'yellow')} %memit <python_code>")
+            return
+        try:
+            compiled = self.shell.interpreter.compile_cell(code_to_run)
+        except (SyntaxError, ValueError, OverflowError) as e:
+            print(color_print(f"Exception: {e}", "red"))
+            return
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        gc.collect()
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        rss_before = peak_rss()
+        self.shell.interpreter.runcode(compiled)
+        gc.collect()
+        after, peak = tracemalloc.get_traced_memory()
+        rss_after = peak_rss()
+        if started_tracing:
+            tracemalloc.stop()
+        line = f"peak memory: {format_bytes(peak - before)}, net: {format_bytes(after - before, signed=True)}"
+        if rss_after is not None:
+            line += f", peak RSS: {format_bytes(rss_after)} (+{format_bytes(rss_after - rss_before)})"
+        print(line)
+
+    @staticmethod
+    def _filtered_snapshot() -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ))
+
+    @magic_command("%memsnap")
+    def handle_memsnap_command(self, arg: str = "") -> None:
+        """
+        记录 tracemalloc 内存快照（首次使用时开始跟踪），-c 清空快照并停止跟踪。
+        """
+        if arg.strip() == "-c":
+            self._mem_snapshots.clear()
+            tracemalloc.stop()
+            print("Snapshots cleared; tracemalloc stopped.")
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            print(color_print("tracemalloc started; only allocations made from now on are traced.", "yellow"))
+        self._mem_snapshots.append(self._filtered_snapshot())
+        current, _ = tracemalloc.get_traced_memory()
+        print(f"Snapshot {len(self._mem_snapshots)} taken ({format_bytes(current)} traced)")
+
+    @magic_command("%memdiff")
+    def handle_memdiff_command(self, arg: str = "") -> None:
+        """
+        比较两个内存快照，列出增长最多的分配位置：%memdiff [-l 行数] [旧编号 [新编号]]
+        """
+        usage = "%memdiff [-l limit] [old_id [new_id]]"
+        limit = 10
+        if match := re.match(r"^-l\s+(\d+)\s*(.*)$", arg.strip()):
+            limit, arg = int(match[1]), match[2]
+        try:
+            ids = [int(x) for x in arg.split()]
+        except ValueError:
+            print(f"{color_print('Usage:', 'yellow')} {usage}")
+            return
+        snapshots = self._mem_snapshots
+        if not snapshots or len(ids) > 2:
+            print(f"{color_print('Usage:', 'yellow')} {usage} (take snapshots with %memsnap first)")
+            return
+        if any(not 1 <= i <= len(snapshots) for i in ids):
+            # 编号从 1 开始，不能当作列表下标直接使用（0 与负数会静默取到其他快照）
+            print(f"{color_print('Usage:', 'yellow')} {usage} (snapshot ids are 1-{len(snapshots)})")
+            return
+        if len(ids) == 2:
+            old, new = snapshots[ids[0] - 1], snapshots[ids[1] - 1]
+            label = f"snapshot {ids[0]} -> {ids[1]}"
+        elif len(ids) == 1:
+            old, new = snapshots[ids[0] - 1], self._filtered_snapshot()
+            label = f"snapshot {ids[0]} -> now"
+        else:
+            old, new = snapshots[-1], self._filtered_snapshot()
+            label = f"snapshot {len(snapshots)} -> now"
+        grown = [stat for stat in new.compare_to(old, "lineno") if stat.size_diff > 0]
+        print(f"Top {min(limit, len(grown))} growing allocation sites ({label}):")
+        for stat in grown[:limit]:
+            frame = stat.traceback[0]
+            print(f"  {format_bytes(stat.size_diff, signed=True):>10} ({stat.count_diff:+} blocks) "
+                  f"{frame.filename}:{frame.lineno}")
+            if source := linecache.getline(frame.filename, frame.lineno).strip():
+                print(f"      {source}")
+        total = sum(stat.size_diff for stat in new.compare_to(old, "filename"))
+        print(f"Total change: {format_bytes(total, signed=True)}")
 
     @magic_command("%who")
     def handle_who_command(self, arg: str = "") -> None:
@@ -193,42 +678,249 @@ class MagicCommandHandler:
     @magic_command("%whos")
     def handle_whos_command(self, arg: str = "") -> None:
         """
-        显示当前会话下所有用户变量及其值。
+        以表格显示用户变量的类型、长度/形状、内存大小与截断的值（-d 计算深度大小）。
         """
+        import shutil
+
+        usage = "%whos [-d]"
+        arg = arg.strip()
+        if arg not in ("", "-d"):
+            print(f"{color_print('Usage:', 'yellow')} {usage}")
+            return
+        deep = arg == "-d"
         local_vars = self.shell.interpreter.locals
-        user_vars = ((k, v) for k, v in local_vars.items() if not k.startswith("__") and not callable(v))
-        if user_vars_list := list(user_vars):
-            print("User variables and values:")
-            for k, v in user_vars_list:
-                print(f"  {k}: {repr(v)}")
-        else:
+        user_vars = [(k, v) for k, v in local_vars.items() if not k.startswith("__") and not callable(v)]
+        if not user_vars:
             print("No user variables defined.")
+            return
+        # 深度大小在变量未重新绑定且长度未变时复用，大对象不必重复遍历
+        cache = {}
+        rows = []
+        for name, value in user_vars:
+            info = VariableInfo.describe(value)
+            size = format_bytes(info.size) if info.size is not None else "?"
+            row = [name, info.type_name, info.length, size]
+            if deep:
+                try:
+                    length = len(value)
+                except Exception:
+                    length = None
+                key = (id(value), type(value), length)
+                cached = self._whos_cache.get(name)
+                sized = cached[3] if cached is not None and cached[:3] == key else deep_sizeof(value, WHOS_TIME_BUDGET)
+                cache[name] = (*key, sized)
+                row.append(format_bytes(sized[0]) if sized[1] else f">{format_bytes(sized[0])}")
+            rows.append((row, info.value))
+        if deep:
+            self._whos_cache = cache
+        headers = ["Variable", "Type", "Len/Shape", "Size"] + (["Deep"] if deep else [])
+        widths = [max(len(header), *(len(row[i]) for row, _ in rows)) for i, header in enumerate(headers)]
+        value_width = max(20, shutil.get_terminal_size().columns - sum(widths) - 2 * len(widths) - 1)
+
+        def format_row(cells):
+            return "  ".join(cell.ljust(width) for cell, width in zip(cells, widths))
+
+        print(color_print(f"{format_row(headers)}  Value", "cyan"))
+        print("-" * min(sum(widths) + 2 * len(widths) + value_width, shutil.get_terminal_size().columns))
+        for row, value in rows:
+            if len(value) > value_width:
+                value = value[:value_width - 3] + "..."
+            print(f"{format_row(row)}  {value}")
 
     @magic_command("%ls")
     def handle_ls_command(self, arg: str = "") -> None:
         """
-        列出当前目录下的文件和目录。
+        列出目录内容：%ls [-l] [--limit N] [目录 | 文件 | 通配符 ...]，大目录边扫描边输出。
         """
-        import os
-        from Core.utils import color_print, Color
-
-        cwd = os.getcwd()
-        all_items = os.listdir(cwd)
-        dirs = sorted([f for f in all_items if os.path.isdir(os.path.join(cwd, f))], key=lambda x: (x.startswith('.'), x.lower()))
-        files = sorted([f for f in all_items if not os.path.isdir(os.path.join(cwd, f))], key=lambda x: (x.startswith('.'), x.lower()))
-
-        def style_name(f, is_dir):
-            if is_dir:
-                return color_print(f, Color.BLUE)
-            elif f.startswith('.'):
-                return color_print(f, Color.WHITE)
+        import glob
+        import shlex
+        import stat
+        from Core.utils import Color
+
+        usage = "%ls [-l] [--limit N] [directory | file | pattern ...]"
+        try:
+            tokens = shlex.split(arg)
+        except ValueError:
+            print(f"{color_print('Usage:', 'yellow')} {usage}")
+            return
+        long_format, limit, named = False, None, False
+        # 目录 -> 文件名模式列表（空列表表示列出全部），按参数顺序输出
+        targets: Dict[str, List[str]] = {}
+        current = "."
+        while tokens:
+            token = tokens.pop(0)
+            if token == "-l":
+                long_format = True
+            elif token == "--limit" and tokens and tokens[0].isdigit():
+                limit = int(tokens.pop(0))
+            elif token.startswith("-"):
+                print(f"{color_print('Usage:', 'yellow')} {usage}")
+                return
+            elif glob.has_magic(token):
+                named = True
+                # 带目录的通配符（如 data/*.csv）拆成目录与文件名模式，不带目录的作用于前一个目录
+                directory, pattern = os.path.split(token)
+                directory = directory or current
+                if os.path.isdir(directory):
+                    targets.setdefault(directory, []).append(pattern or "*")
+                else:
+                    print(f"{color_print('Error:', 'red')} {directory}: No such directory")
+            elif os.path.isdir(token):
+                named = True
+                current = token
+                targets[token] = []
+            elif os.path.lexists(token):
+                named = True
+                directory, name = os.path.split(token)
+                targets.setdefault(directory or ".", []).append(glob.escape(name))
             else:
-                return f
+                named = True
+                print(f"{color_print('Error:', 'red')} {token}: No such file or directory")
+        if not named:
+            targets["."] = []
+
+        def style_name(entry):
+            if entry.is_dir:
+                return color_print(entry.name, Color.BLUE)
+            elif entry.name.startswith('.'):
+                return color_print(entry.name, Color.WHITE)
+            else:
+                return entry.name
+
+        shown, is_sorted = 0, True
+        for path, patterns in targets.items():
+            if limit is not None and shown >= limit:
+                break
+            if len(targets) > 1:
+                print(color_print(f"{path}:", "cyan"))
+            try:
+                for entry, is_sorted in self._lister.list(path, patterns, need_stat=long_format,
+                                                          limit=None if limit is None else limit - shown):
+                    if long_format:
+                        st = entry.stat
+                        modified = time.strftime("%Y-%m-%d %H:%M", time.localtime(st.st_mtime))
+                        print(f"{stat.filemode(st.st_mode)} {format_bytes(st.st_size):>9}  {modified}  {style_name(entry)}")
+                    else:
+                        print(style_name(entry))
+                    shown += 1
+            except OSError as e:
+                print(f"{color_print('Error:', 'red')} {e}")
+        if limit is not None and shown == limit:
+            print(color_print(f"(limited to {limit:,} entries, shown in directory order)", "yellow"))
+        elif not is_sorted:
+            print(color_print("(large directory: entries shown in directory order)", "yellow"))
+
+    @magic_command("%page")
+    def handle_page_command(self, arg: str = "") -> None:
+        """
+        在分页器中流式查看表达式的完整 repr（Out[n] 被截断时使用）。
+        """
+        from Core.display import page
+
+        if not arg.strip():
+            print(f"{color_print('Usage:', 'yellow')} %page <expression>")
+            return
+        try:
+            value = eval(self.shell.interpreter.compile_cell(arg.strip(), symbol="eval"),
+                         self.shell.interpreter.locals)
+        except SystemExit:
+            raise
+        except BaseException:
+            self.shell.interpreter.showtraceback()
+            return
+        page(value)
+
+    @magic_command("%outcache")
+    def handle_outcache_command(self, arg: str = "") -> None:
+        """
+        查看输出缓存（Out[n]）的占用，-c 清空，-m MB 设置内存上限。
+        """
+        usage = "%outcache [-c] [-m MB]"
+        cache = getattr(self.shell, "output_cache", None)
+        if cache is None:
+            print("The output cache is only available in the interactive shell.")
+            return
+        arg = arg.strip()
+        if arg == "-c":
+            cache.clear()
+            print("Output cache cleared.")
+            return
+        if match := re.match(r"^-m\s+(\d+(?:\.\d+)?)$", arg):
+            cache.max_bytes = int(float(match[1]) * 1024 * 1024)
+            cache.evict()
+        elif arg:
+            print(f"{color_print('Usage:', 'yellow')} {usage}")
+            return
+        strong, weak = cache.stats()
+        print(f"{strong} cached, {weak} weak references, "
+              f"{format_bytes(cache.total + cache.slot_bytes)} of {format_bytes(cache.max_bytes)}")
+        for number, type_name, size, is_weak in cache.entries():
+            print(f"  Out[{number}]: {type_name:<16} {format_bytes(size):>10}{'  (weak)' if is_weak else ''}")
+
+    def _namespace_checkpoint(self, arg: str, usage: str):
+        """
+        解析 [-d 目录] [变量名 ...]，返回 (NamespaceCheckpoint, 目录, 变量名列表或 None)。
+        """
+        if self._checkpoint is None:
+            session_objects = (getattr(self.shell, "output_cache", None),)
+            self._checkpoint = NamespaceCheckpoint(self.shell.interpreter.locals,
+                                                   exclude=[obj for obj in session_objects if obj is not None])
+        directory = default_checkpoint_dir()
+        parts = arg.split()
+        if parts[:1] == ["-d"]:
+            if len(parts) < 2:
+                print(f"{color_print('Usage:', 'yellow')} {usage}")
+                return None
+            directory, parts = os.path.expanduser(parts[1]), parts[2:]
+        if any(not name.isidentifier() for name in parts):
+            print(f"{color_print('Usage:', 'yellow')} {usage}")
+            return None
+        return self._checkpoint, directory, parts or None
+
+    @staticmethod
+    def _report_skipped(report: CheckpointReport) -> None:
+        for name, reason in report.skipped:
+            print(color_print(f"  skipped {name}: {reason}", "yellow"))
 
-        for d in dirs:
-            print(style_name(d, True))
-        for f in files:
-            print(style_name(f, False))
+    @magic_command("%save_ns")
+    def handle_save_ns_command(self, arg: str = "") -> None:
+        """
+        增量保存命名空间快照：%save_ns [-f] [-d 目录] [变量名 ...]，只写入有变化的变量。
+        可变对象按长度与大小判断是否变化，-f 强制重新序列化（用于不改变大小的原地修改）。
+        """
+        force = arg.split()[:1] == ["-f"]
+        if force:
+            arg = arg.split(None, 1)[1] if len(arg.split()) > 1 else ""
+        if (parsed := self._namespace_checkpoint(arg, "%save_ns [-f] [-d directory] [name ...]")) is None:
+            return
+        checkpoint, directory, names = parsed
+        try:
+            report = checkpoint.save(directory, names, force)
+        except OSError as e:
+            print(color_print(f"Error: {e}", "red"))
+            return
+        print(f"Saved {len(report.written)} changed, {len(report.unchanged)} unchanged variables to {directory} "
+              f"({format_bytes(report.bytes)} written, {TimeFormatter.format_time(report.elapsed)})")
+        self._report_skipped(report)
+
+    @magic_command("%load_ns")
+    def handle_load_ns_command(self, arg: str = "") -> None:
+        """
+        从快照恢复命名空间：%load_ns [-d 目录] [变量名 ...]。
+        """
+        if (parsed := self._namespace_checkpoint(arg, "%load_ns [-d directory] [name ...]")) is None:
+            return
+        checkpoint, directory, names = parsed
+        try:
+            report = checkpoint.load(directory, names)
+        except OSError as e:
+            print(color_print(f"Error: {e}", "red"))
+            return
+        print(f"Restored {len(report.written)} variables from {directory} "
+              f"({format_bytes(report.bytes)} read, {TimeFormatter.format_time(report.elapsed)})")
+        self._report_skipped(report)
+        if hasattr(self.shell, "completion_index"):
+            self.shell.completion_index.refresh()
 
     @magic_command("%pwd")
     def handle_pwd_command(self, arg: str = "") -> None:
@@ -238,6 +930,141 @@ class MagicCommandHandler:
         import os
         print(f"Current working directory: {os.getcwd()}")
 
+    @magic_command("%bg")
+    def handle_bg_command(self, code_to_run: str) -> None:
+        """
+        在后台线程中执行代码，提示符保持可用。
+        """
+        if not code_to_run:
+            print(f"{color_print('Usage:', 'yellow')} %bg <python_code>")
+            return
+        try:
+            self.shell.jobs.submit(code_to_run)
+        except SyntaxError as e:
+            print(color_print(f"SyntaxError: {e}", "red"))
+
+    @magic_command("%jobs")
+    def handle_jobs_command(self, arg: str = "") -> None:
+        """
+        列出后台作业及其状态和耗时。
+        """
+        if not self.shell.jobs.jobs:
+            print("No background jobs.")
+            return
+        for job in self.shell.jobs.jobs.values():
+            print(f"  {job.summary(width=60)}")
+
+    def _parse_job(self, arg: str, usage: str):
+        try:
+            job = self.shell.jobs.get(int(arg))
+        except ValueError:
+            print(f"{color_print('Usage:', 'yellow')} {usage}")
+            return None
+        if job is None:
+            print(color_print(f"No such job: {arg}", "red"))
+        return job
+
+    @magic_command("%wait")
+    def handle_wait_command(self, arg: str = "") -> None:
+        """
+        等待指定（或全部）后台作业结束，Ctrl+C 仅中断等待。
+        """
+        arg = arg.strip()
+        if arg:
+            if (job := self._parse_job(arg, "%wait [job_id]")) is None:
+                return
+            jobs = [job]
+        else:
+            jobs = self.shell.jobs.running()
+        try:
+            for job in jobs:
+                self.shell.jobs.wait(job)
+        except KeyboardInterrupt:
+            print(color_print("Stopped waiting; jobs keep running in the background.", "yellow"))
+
+    @magic_command("%kill")
+    def handle_kill_command(self, arg: str = "") -> None:
+        """
+        终止指定的后台作业。
+        """
+        if (job := self._parse_job(arg.strip(), "%kill <job_id>")) is None:
+            return
+        if self.shell.jobs.kill(job):
+            print(color_print(f"[{job.id}] kill requested", "yellow"))
+        else:
+            print(color_print(f"[{job.id}] is not running", "yellow"))
+
+    @magic_command("%pmap")
+    def handle_pmap_command(self, arg: str = "") -> None:
+        """
+        在常驻进程池中并行 map：%pmap [-w 进程数] [-c 块大小] [-o 变量名] func iterable
+        """
+        usage = "%pmap [-w workers] [-c chunksize] [-o name] <func> <iterable>"
+        options = {"-w": None, "-c": None, "-o": "_pmap"}
+        while match := re.match(r"^(-[wco])\s+(\S+)\s*(.*)$", arg.strip(), re.S):
+            options[match[1]], arg = match[2], match[3]
+        parts = arg.strip().split(maxsplit=1)
+        if len(parts) != 2:
+            print(f"{color_print('Usage:', 'yellow')} {usage}")
+            return
+        local_vars = self.shell.interpreter.locals
+        try:
+            workers = int(options["-w"]) if options["-w"] else None
+            chunksize = int(options["-c"]) if options["-c"] else None
+            func = eval(parts[0], local_vars)
+            items = list(eval(parts[1], local_vars))
+        except Exception as e:
+            print(color_print(f"Exception: {e}", "red"))
+            return
+
+        results, per_worker = [], {}
+        start = time.perf_counter()
+        try:
+            for pid, busy, chunk in self.shell.parallel.map(func, items, chunksize, workers):
+                results.extend(chunk)
+                items_done, busy_total = per_worker.get(pid, (0, 0.0))
+                per_worker[pid] = (items_done + len(chunk), busy_total + busy)
+                elapsed = time.perf_counter() - start
+                sys.stdout.write(f"\r  {len(results)}/{len(items)} items, {len(results) / elapsed:,.0f} items/s")
+                sys.stdout.flush()
+        except KeyboardInterrupt:
+            print(color_print("\n%pmap interrupted; pending chunks cancelled.", "yellow"))
+            return
+        except Exception as e:
+            print(color_print(f"\nException: {e}", "red"))
+            return
+        elapsed = time.perf_counter() - start
+        print()
+        local_vars[options["-o"]] = results
+        print(f"{len(results)} results stored in {options['-o']} "
+              f"({TimeFormatter.format_time(elapsed)}, {len(per_worker)} workers)")
+        for pid, (items_done, busy) in sorted(per_worker.items()):
+            rate = items_done / busy if busy else float("inf")
+            print(f"  pid {pid}: {items_done} items, busy {TimeFormatter.format_time(busy)}, {rate:,.0f} items/s")
+
+    @magic_command("%sh")
+    def handle_sh_command(self, arg: str = "") -> None:
+        """
+        切换 !cmd 的常驻 shell 协进程：%sh [on|off]，cd、export 等状态在命令间保留。
+        """
+        arg = arg.strip()
+        system = self.shell.system
+        if arg == "on":
+            try:
+                system.start_persistent()
+            except OSError as e:
+                print(color_print(f"Error: {e}", "red"))
+                return
+        elif arg == "off":
+            system.stop_persistent()
+        elif arg:
+            print(f"{color_print('Usage:', 'yellow')} %sh [on|off]")
+            return
+        if system.persistent:
+            print(f"Persistent shell: on ({system.coprocess.executable}, pid {system.coprocess.process.pid})")
+        else:
+            print("Persistent shell: off (each !cmd starts a new shell)")
+
     @magic_command("%help")
     def handle_help_command(self, arg: str = "") -> None:
         """
@@ -0,0 +1,191 @@
+# module_index.py
+
+import hashlib
+import importlib.machinery
+import json
+import os
+import sys
+import tempfile
+import threading
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+from Core.bytecode_cache import user_cache_dir
+
+_INDEX_VERSION = 2
+_MODULE_SUFFIXES = tuple(sorted(importlib.machinery.all_suffixes(), key=len, reverse=True))
+
+# 目录 -> (mtime_ns, 模块名, 子包名, 可能是命名空间包的子目录名)
+DirEntry = Tuple[int, List[str], List[str], List[str]]
+
+
+def default_index_path() -> str:
+    """
+    模块索引文件路径，按解释器前缀与版本区分，可通过环境变量 SINGLEPYTHON_MODULE_INDEX 覆盖。
+    """
+    if env_path := os.environ.get("SINGLEPYTHON_MODULE_INDEX"):
+        return env_path
+    key = hashlib.sha1(f"{sys.prefix}:{sys.version}".encode("utf-8")).hexdigest()[:16]
+    return os.path.join(user_cache_dir(), f"modules-{key}.json")
+
+
+def _scan_dir(directory: str) -> Tuple[List[str], List[str], List[str]]:
+    """
+    列出目录中的模块（源码、字节码与扩展模块）、含 __init__ 的子包，以及其余名字合法的子目录。
+    """
+    modules, packages, namespaces = set(), set(), set()
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            name = entry.name
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                continue
+            if is_dir:
+                if not name.isidentifier() or name == "__pycache__":
+                    continue
+                if any(os.path.exists(os.path.join(entry.path, f"__init__{suffix}")) for suffix in (".py", ".pyc")):
+                    packages.add(name)
+                else:
+                    namespaces.add(name)
+                continue
+            for suffix in _MODULE_SUFFIXES:
+                if name.endswith(suffix):
+                    module = name[:-len(suffix)].partition(".")[0]  # 去掉 .cpython-312-x86_64-linux-gnu
+                    if module.isidentifier() and module != "__init__":
+                        modules.add(module)
+                    break
+    return sorted(modules - packages), sorted(packages), sorted(namespaces)
+
+
+class ModuleIndex:
+    """
+    可导入模块索引：记录 sys.path 上所有顶层模块与子模块，按包存放已排序的子项名。
+    各目录的列表连同目录 mtime 持久化到磁盘，刷新时只重新列出 mtime 变化的目录，
+    避免每次启动都用 pkgutil.iter_modules 扫描整个环境。
+    """
+
+    def __init__(self, path: Optional[str] = None, search_path: Optional[List[str]] = None) -> None:
+        self.path = path or default_index_path()
+        self.search_path = search_path
+        self._dirs: Dict[str, DirEntry] = {}
+        # 包名（顶层为 ""）-> 已排序的子模块名
+        self._children: Dict[str, List[str]] = {}
+        self.ready = threading.Event()
+
+    def load(self) -> bool:
+        """
+        读取磁盘上的索引，立即可用于补全（内容可能略旧，随后由 refresh 校正）。
+        """
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if data.get("version") != _INDEX_VERSION:
+            return False
+        self._dirs = {directory: tuple(entry) for directory, entry in data.get("dirs", {}).items()}
+        self._children = {package: names for package, names in data.get("children", {}).items()}
+        return True
+
+    def save(self) -> None:
+        """
+        临时文件 + os.replace 原子写入，失败时静默忽略。
+        """
+        data = {"version": _INDEX_VERSION, "dirs": self._dirs, "children": self._children}
+        tmp_path = None
+        try:
+            directory = os.path.dirname(self.path) or "."
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+            tmp_path = None
+        except OSError:
+            pass
+        finally:
+            if tmp_path is not None:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+
+    def _listing(self, directory: str, dirs: Dict[str, DirEntry]) -> Optional[DirEntry]:
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except OSError:
+            return None
+        entry = self._dirs.get(directory)
+        if entry is None or entry[0] != mtime:
+            try:
+                entry = (mtime, *_scan_dir(directory))
+            except OSError:
+                return None
+        dirs[directory] = entry
+        return entry
+
+    def _walk_package(self, package: str, directory: str, dirs: Dict[str, DirEntry],
+                      children: Dict[str, set]) -> None:
+        entry = self._listing(directory, dirs)
+        if entry is None:
+            return
+        _, modules, packages, namespaces = entry
+        names = children.setdefault(package, set())
+        names.update(modules)
+        names.update(packages)
+        for name in packages:
+            self._walk_package(f"{package}.{name}" if package else name, os.path.join(directory, name),
+                               dirs, children)
+        if package:
+            return
+        # sys.path 目录下没有 __init__ 但含模块的子目录按命名空间包处理（只看顶层，避免遍历无关目录）
+        for name in namespaces:
+            sub_entry = self._listing(os.path.join(directory, name), dirs)
+            if sub_entry is not None and (sub_entry[1] or sub_entry[2]):
+                names.add(name)
+                children.setdefault(name, set()).update(sub_entry[1], sub_entry[2])
+                for sub in sub_entry[2]:
+                    self._walk_package(f"{name}.{sub}", os.path.join(directory, name, sub), dirs, children)
+
+    def refresh(self) -> bool:
+        """
+        按 mtime 校验各目录，只重新列出有变化的目录；索引有变化时写回磁盘。
+        :return: 索引是否有变化
+        """
+        dirs: Dict[str, DirEntry] = {}
+        children: Dict[str, set] = {"": set(sys.builtin_module_names)}
+        for entry in self.search_path if self.search_path is not None else sys.path:
+            directory = os.path.abspath(entry or os.getcwd())
+            if directory not in dirs and os.path.isdir(directory):
+                self._walk_package("", directory, dirs, children)
+        changed = dirs != self._dirs
+        self._dirs = dirs
+        self._children = {package: sorted(names) for package, names in children.items()}
+        if changed:
+            self.save()
+        return changed
+
+    def start(self) -> threading.Thread:
+        """
+        后台线程：先载入磁盘索引，再刷新。
+        """
+        def worker() -> None:
+            if self.load():
+                self.ready.set()
+            self.refresh()
+            self.ready.set()
+
+        thread = threading.Thread(target=worker, name="module-index", daemon=True)
+        thread.start()
+        return thread
+
+    def complete(self, prefix: str) -> List[str]:
+        """
+        补全点号模块名，只列出下一级（如 "xml." -> xml.dom、xml.etree ...）。
+        """
+        package, _, partial = prefix.rpartition(".")
+        names = self._children.get(package, [])
+        start = bisect_left(names, partial)
+        end = bisect_left(names, partial + "\U0010ffff", start)
+        return [f"{package}.{name}" if package else name for name in names[start:end]]
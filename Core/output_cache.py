@@ -0,0 +1,187 @@
+# output_cache.py
+
+import itertools
+import os
+import sys
+import weakref
+from collections import OrderedDict
+from collections.abc import Mapping
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from Core.sizing import deep_sizeof
+
+DEFAULT_OUTPUT_CACHE_SIZE = 128 * 1024 * 1024  # 字节
+SIZE_BUDGET = 0.01  # 估算单个结果大小的时间预算（秒）
+_SAMPLE = 64  # 外推时抽样的元素个数
+_SLOTS = ("_", "__", "___")
+
+
+def default_output_cache_size() -> int:
+    """
+    输出缓存的内存上限（字节），可通过环境变量 SINGLEPYTHON_OUTPUT_CACHE_SIZE 覆盖。
+    """
+    try:
+        return int(os.environ.get("SINGLEPYTHON_OUTPUT_CACHE_SIZE", DEFAULT_OUTPUT_CACHE_SIZE))
+    except ValueError:
+        return DEFAULT_OUTPUT_CACHE_SIZE
+
+
+def estimate_size(value: Any) -> int:
+    """
+    估算结果占用的字节数。对象图在预算内遍历不完时，内置容器按前若干个元素的平均大小外推。
+    """
+    size, complete = deep_sizeof(value, SIZE_BUDGET)
+    if complete or type(value) not in (list, tuple, set, frozenset, dict):
+        return size
+    items = list(itertools.islice(value.items() if isinstance(value, dict) else value, _SAMPLE))
+    if not items:
+        return size
+    sample = sum(deep_sizeof(item, SIZE_BUDGET / _SAMPLE)[0] for item in items) / len(items)
+    return max(size, sys.getsizeof(value) + int(sample * len(value)))
+
+
+@dataclass
+class _Entry:
+    value: Any  # 强引用的结果，降级后为 None
+    ref: Optional[weakref.ref]  # 降级后的弱引用
+    size: int
+
+
+class OutputCache(Mapping):
+    """
+    Out[n] 输出缓存：按估算字节数限制强引用结果的总量，超出时按最近最少使用的顺序淘汰。
+    被淘汰的结果能弱引用时降级为弱引用——只要对象仍被其他变量引用，Out[n] 依旧可用，
+    但缓存本身不再让它常驻内存；不能弱引用的直接删除。
+    命名空间中的 _、__、___ 也由缓存维护（见 rotate），同样受内存上限约束。
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None, namespace: Optional[Dict[str, Any]] = None) -> None:
+        self.max_bytes = default_output_cache_size() if max_bytes is None else max_bytes
+        self.namespace = namespace
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self.total = 0  # 强引用结果的估算字节数
+        # _、__、___ -> (对象 id, 所属 Out 编号, 估算字节数)；只记录 id，不额外持有对象
+        self._slots: Dict[str, Tuple[int, Optional[int], int]] = {}
+
+    @property
+    def slot_bytes(self) -> int:
+        """
+        不属于任何 Out 条目的 _、__、___（如 %timeit -o 的结果）的估算字节数，计入内存上限。
+        """
+        return sum(size for _, number, size in self._slots.values() if number is None)
+
+    def rotate(self, value: Any, number: Optional[int] = None) -> None:
+        """
+        更新 _、__、___：对 _ 的赋值都经由这里。来自 Out[number] 的值在该条目被淘汰时一并释放，
+        其他值的大小计入内存上限，超出时从最旧的开始释放；单个结果超出上限时不绑定。
+        """
+        if self.namespace is None:
+            return
+        namespace = self.namespace
+        size = 0 if number is not None else estimate_size(value)
+        entry = self._entries.get(number) if number is not None else None
+        if size > self.max_bytes or (number is not None and (entry is None or entry.ref is not None)):
+            return  # 结果本身已超出上限（Out 中已被降级），不再通过 _ 让它常驻内存
+        slots = {"_": (id(value), number, size)}
+        for new, old in (("__", "_"), ("___", "__")):
+            if old in self._slots:
+                slots[new] = self._slots[old]
+        self._slots = slots
+        namespace["___"], namespace["__"], namespace["_"] = namespace.get("__"), namespace.get("_"), value
+        self.evict()
+
+    def _release(self, predicate) -> None:
+        for name in reversed(_SLOTS):
+            slot = self._slots.get(name)
+            if slot is None or not predicate(slot):
+                continue
+            del self._slots[name]
+            # 用户自行重新绑定过的名字不动
+            if self.namespace is not None and id(self.namespace.get(name)) == slot[0]:
+                del self.namespace[name]
+
+    def store(self, number: int, value: Any) -> None:
+        """
+        缓存 Out[number]。单个结果超出上限时不挤占其他条目（包括 _、__、___ 所指的），
+        能弱引用就只保存弱引用，否则只显示不缓存。缓存自身（显示 Out）不存入。
+        """
+        self.discard(number)
+        if value is self:
+            return
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            try:
+                ref = weakref.ref(value, lambda _, number=number: self._entries.pop(number, None))
+            except TypeError:
+                return
+            self._entries[number] = _Entry(None, ref, size)
+            return
+        self._entries[number] = _Entry(value, None, size)
+        self.total += size
+        self.evict()
+
+    def discard(self, number: int) -> None:
+        entry = self._entries.pop(number, None)
+        if entry is not None and entry.ref is None:
+            self.total -= entry.size
+
+    def evict(self) -> None:
+        """
+        从最久未使用的结果开始降级/删除，直到强引用总量不超过上限；
+        指向被淘汰结果的 _、__、___ 随之释放，否则它们仍会让结果常驻内存。
+        """
+        if self.total + self.slot_bytes > self.max_bytes:
+            self._release(lambda slot: slot[1] is None)
+        for number in list(self._entries):
+            if self.total <= self.max_bytes:
+                break
+            entry = self._entries[number]
+            if entry.ref is not None:
+                continue
+            self.total -= entry.size
+            self._release(lambda slot: slot[1] == number)
+            try:
+                entry.ref = weakref.ref(entry.value, lambda _, number=number: self._entries.pop(number, None))
+            except TypeError:
+                del self._entries[number]
+            else:
+                entry.value = None
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.total = 0
+        self._release(lambda slot: True)
+
+    def stats(self) -> Tuple[int, int]:
+        """
+        :return: (强引用条目数, 弱引用条目数)
+        """
+        weak = sum(1 for entry in self._entries.values() if entry.ref is not None)
+        return len(self._entries) - weak, weak
+
+    def entries(self) -> Iterator[Tuple[int, str, int, bool]]:
+        """
+        按最近使用顺序（旧到新）列出 (编号, 类型名, 估算字节数, 是否弱引用)。
+        """
+        for number, entry in list(self._entries.items()):
+            value = entry.value if entry.ref is None else entry.ref()
+            yield number, type(value).__name__, entry.size, entry.ref is not None
+
+    def __getitem__(self, number: int) -> Any:
+        entry = self._entries[number]
+        value = entry.value if entry.ref is None else entry.ref()
+        if entry.ref is not None and value is None:
+            raise KeyError(number)
+        self._entries.move_to_end(number)
+        return value
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(list(self._entries))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __repr__(self) -> str:
+        strong, weak = self.stats()
+        return f"<OutputCache: {strong} cached, {weak} weak, {self.total:,} of {self.max_bytes:,} bytes>"
@@ -0,0 +1,171 @@
+# parallel.py
+
+import builtins
+import dis
+import importlib
+import marshal
+import os
+import pickle
+import time
+import types
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# 工作进程内的命名空间：由初始化函数导入会话中已导入的模块
+_WORKER_NAMESPACE: Dict[str, Any] = {}
+# 工作进程最近一次收到的任务函数 (pickle 字节, 函数)，同一次 map 的后续分块无需重新载入
+_WORKER_FUNCTION: List[Any] = [None, None]
+_GLOBAL_OPS = {"LOAD_GLOBAL", "LOAD_NAME"}
+
+
+@dataclass(frozen=True)
+class SessionFunction:
+    """
+    会话中定义的函数无法按引用 pickle，改为传递字节码与其引用到的全局变量，在工作进程中重建。
+    全局变量在检查能否 pickle 时即序列化，之后不再重复 pickle。
+    """
+    name: str
+    code: bytes
+    defaults: Optional[tuple]
+    kwdefaults: Optional[dict]
+    captured: Dict[str, Any]  # 变量名 -> pickle 字节或 SessionFunction
+
+
+def _init_worker(imports: Dict[str, str]) -> None:
+    for alias, module_name in imports.items():
+        try:
+            _WORKER_NAMESPACE[alias] = importlib.import_module(module_name)
+        except Exception:
+            pass
+
+
+def _materialize(spec: SessionFunction) -> Callable:
+    namespace = dict(_WORKER_NAMESPACE)
+    namespace["__builtins__"] = builtins
+    func = types.FunctionType(marshal.loads(spec.code), namespace, spec.name, spec.defaults)
+    func.__kwdefaults__ = spec.kwdefaults
+    namespace[spec.name] = func  # 支持递归
+    for key, value in spec.captured.items():
+        namespace[key] = _materialize(value) if isinstance(value, SessionFunction) else pickle.loads(value)
+    return func
+
+
+def _global_names(code: types.CodeType) -> List[str]:
+    """
+    函数及其内嵌的 lambda、推导式等代码对象按全局变量读取的名字（按出现顺序去重）。
+    co_names 还包含属性名，这里只取 LOAD_GLOBAL/LOAD_NAME 指令的参数。
+    """
+    names = dict.fromkeys(instr.argval for instr in dis.get_instructions(code) if instr.opname in _GLOBAL_OPS)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names.update(dict.fromkeys(_global_names(const)))
+    return list(names)
+
+
+def _load_function(payload: bytes) -> Callable:
+    if _WORKER_FUNCTION[0] != payload:
+        func = pickle.loads(payload)
+        _WORKER_FUNCTION[:] = payload, _materialize(func) if isinstance(func, SessionFunction) else func
+    return _WORKER_FUNCTION[1]
+
+
+def _run_chunk(payload: bytes, items: List[Any]) -> Tuple[int, float, List[Any]]:
+    func = _load_function(payload)
+    start = time.perf_counter()
+    results = [func(item) for item in items]
+    return os.getpid(), time.perf_counter() - start, results
+
+
+class ParallelPool:
+    """
+    常驻进程池：首次使用时创建，工作进程启动时导入会话中的模块；
+    会话导入了新模块时重建进程池。
+    """
+
+    def __init__(self, interpreter, max_workers: Optional[int] = None) -> None:
+        self.interpreter = interpreter
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._executor = None
+        self._imports: Dict[str, str] = {}
+
+    def _session_imports(self) -> Dict[str, str]:
+        return {name: value.__name__ for name, value in self.interpreter.locals.items()
+                if isinstance(value, types.ModuleType) and not name.startswith("__")}
+
+    def executor(self, max_workers: Optional[int] = None):
+        """
+        返回已预热的进程池，导入或进程数变化时重建。
+        """
+        from concurrent.futures import ProcessPoolExecutor
+
+        workers = max_workers or self.max_workers
+        imports = self._session_imports()
+        stale = (self._executor is None or workers != self.max_workers
+                 or not imports.items() <= self._imports.items())
+        if stale:
+            self.shutdown()
+            self.max_workers = workers
+            self._imports = imports
+            self._executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                                 initargs=(imports,))
+        return self._executor
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def prepare(self, func: Callable, _seen=None):
+        """
+        会话内定义的函数转为 SessionFunction，其他可调用对象原样按引用 pickle。
+        """
+        session_name = self.interpreter.locals.get("__name__")
+        if not isinstance(func, types.FunctionType) or func.__module__ != session_name:
+            return func
+        if func.__closure__:
+            raise ValueError(f"{func.__name__} uses closure variables and cannot be sent to worker processes")
+        seen = _seen if _seen is not None else set()
+        seen.add(func.__name__)
+        captured = {}
+        for name in _global_names(func.__code__):
+            if name in seen or name not in func.__globals__:
+                continue
+            value = func.__globals__[name]
+            if isinstance(value, types.ModuleType):
+                continue  # 由工作进程初始化时导入
+            if isinstance(value, types.FunctionType) and value.__module__ == session_name:
+                captured[name] = self.prepare(value, seen)
+                continue
+            try:
+                captured[name] = pickle.dumps(value)
+            except Exception:
+                continue
+        return SessionFunction(func.__name__, marshal.dumps(func.__code__), func.__defaults__,
+                               func.__kwdefaults__, captured)
+
+    def map(self, func: Callable, items: List[Any], chunksize: Optional[int] = None,
+            max_workers: Optional[int] = None):
+        """
+        分块分发到进程池，按输入顺序逐块产出结果。
+        :return: 生成器，产出 (pid, 耗时, 结果列表)
+        """
+        from concurrent.futures.process import BrokenProcessPool
+
+        # 函数及其全局变量只 pickle 一次，每个分块复用同一份字节
+        payload = pickle.dumps(self.prepare(func))
+        executor = self.executor(max_workers)
+        if not chunksize:
+            chunksize = max(1, -(-len(items) // (self.max_workers * 4)))
+        futures = []
+        try:
+            for i in range(0, len(items), chunksize):
+                futures.append(executor.submit(_run_chunk, payload, items[i:i + chunksize]))
+            for future in futures:
+                yield future.result()
+        except BrokenProcessPool:
+            # 工作进程崩溃后进程池不可再用，丢弃它，下次调用时重建
+            self.shutdown()
+            raise
+        finally:
+            for future in futures:
+                future.cancel()
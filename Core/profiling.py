@@ -0,0 +1,277 @@
+# profiling.py
+
+import inspect
+import linecache
+import os
+import sys
+import threading
+import time
+from types import CodeType, FunctionType
+from typing import Callable, Dict, Iterable, List, Tuple
+
+_HAS_MONITORING = hasattr(sys, "monitoring")
+
+
+def _unwrap_function(obj) -> FunctionType:
+    """
+    取出方法、staticmethod/classmethod、装饰器包装背后的 Python 函数。
+    """
+    obj = getattr(obj, "__func__", obj)
+    obj = inspect.unwrap(obj)
+    if not isinstance(obj, FunctionType):
+        raise TypeError(f"{obj!r} is not a Python function")
+    return obj
+
+
+class LineProfiler:
+    """
+    逐行计时：记录指定函数每行的命中次数与累计耗时（含该行内的调用）。
+    Python 3.12+ 使用 sys.monitoring 仅对目标代码对象开启事件，旧版本退回 sys.settrace。
+    """
+
+    def __init__(self, functions: Iterable[Callable]) -> None:
+        self.functions: List[FunctionType] = [_unwrap_function(f) for f in functions]
+        self._codes = {f.__code__ for f in self.functions}
+        # code -> {行号: [命中次数, 累计秒数]}
+        self.stats: Dict[CodeType, Dict[int, List[float]]] = {code: {} for code in self._codes}
+        self._last: Dict[int, Tuple[CodeType, int, float]] = {}  # 帧 id -> (code, 上一行, 时间戳)
+        self._tool_id = None
+        self._old_trace = None
+
+    # ---- 公共计时逻辑 ----
+    def _on_line(self, frame_id: int, code: CodeType, lineno: int) -> None:
+        now = time.perf_counter()
+        last = self._last.get(frame_id)
+        if last is not None:
+            entry = self.stats[last[0]].setdefault(last[1], [0, 0.0])
+            entry[1] += now - last[2]
+        entry = self.stats[code].setdefault(lineno, [0, 0.0])
+        entry[0] += 1
+        self._last[frame_id] = (code, lineno, time.perf_counter())
+
+    def _on_exit(self, frame_id: int) -> None:
+        now = time.perf_counter()
+        last = self._last.pop(frame_id, None)
+        if last is not None:
+            entry = self.stats[last[0]].setdefault(last[1], [0, 0.0])
+            entry[1] += now - last[2]
+
+    # ---- sys.monitoring (3.12+) ----
+    def _monitor_start(self, code, offset) -> None:
+        self._last.pop(id(sys._getframe(1)), None)
+
+    def _monitor_line(self, code, lineno) -> None:
+        self._on_line(id(sys._getframe(1)), code, lineno)
+
+    def _monitor_return(self, code, offset, value) -> None:
+        self._on_exit(id(sys._getframe(1)))
+
+    def _monitor_unwind(self, code, offset, exception) -> None:
+        # PY_UNWIND 只能全局开启，这里过滤掉非目标函数
+        if code in self._codes:
+            self._on_exit(id(sys._getframe(1)))
+
+    def _enable_monitoring(self) -> None:
+        monitoring = sys.monitoring
+        for tool_id in (monitoring.PROFILER_ID, monitoring.OPTIMIZER_ID, 3, 4):
+            if monitoring.get_tool(tool_id) is None:
+                monitoring.use_tool_id(tool_id, "SinglePython %lprun")
+                self._tool_id = tool_id
+                break
+        else:
+            raise RuntimeError("No free sys.monitoring tool id for the line profiler")
+        events = monitoring.events
+        monitoring.register_callback(self._tool_id, events.PY_START, self._monitor_start)
+        monitoring.register_callback(self._tool_id, events.LINE, self._monitor_line)
+        monitoring.register_callback(self._tool_id, events.PY_RETURN, self._monitor_return)
+        monitoring.register_callback(self._tool_id, events.PY_YIELD, self._monitor_return)
+        monitoring.register_callback(self._tool_id, events.PY_UNWIND, self._monitor_unwind)
+        for code in self._codes:
+            monitoring.set_local_events(
+                self._tool_id, code, events.PY_START | events.LINE | events.PY_RETURN | events.PY_YIELD)
+        # 抛出异常的行没有 PY_RETURN，由 PY_UNWIND 结束计时（与 settrace 回退中的 'return' 一致）
+        monitoring.set_events(self._tool_id, events.PY_UNWIND)
+
+    def _disable_monitoring(self) -> None:
+        monitoring = sys.monitoring
+        monitoring.set_events(self._tool_id, 0)
+        for code in self._codes:
+            monitoring.set_local_events(self._tool_id, code, 0)
+        for event in (monitoring.events.PY_START, monitoring.events.LINE, monitoring.events.PY_RETURN,
+                      monitoring.events.PY_YIELD, monitoring.events.PY_UNWIND):
+            monitoring.register_callback(self._tool_id, event, None)
+        monitoring.free_tool_id(self._tool_id)
+        self._tool_id = None
+
+    # ---- sys.settrace 回退 ----
+    def _global_trace(self, frame, event, arg):
+        if event == "call" and frame.f_code in self._codes:
+            self._last.pop(id(frame), None)
+            return self._local_trace
+        return None
+
+    def _local_trace(self, frame, event, arg):
+        if event == "line":
+            self._on_line(id(frame), frame.f_code, frame.f_lineno)
+        elif event == "return":
+            self._on_exit(id(frame))
+        return self._local_trace
+
+    def __enter__(self) -> "LineProfiler":
+        if _HAS_MONITORING:
+            self._enable_monitoring()
+        else:
+            self._old_trace = sys.gettrace()
+            sys.settrace(self._global_trace)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if _HAS_MONITORING:
+            self._disable_monitoring()
+        else:
+            sys.settrace(self._old_trace)
+        self._last.clear()
+
+    def format_stats(self) -> str:
+        """
+        生成带注释的源码清单：行号、命中次数、耗时、每次耗时、占比与源码。
+        """
+        from Core.magic_commands import TimeFormatter
+
+        output = []
+        for func in self.functions:
+            code = func.__code__
+            stats = self.stats[code]
+            total = sum(entry[1] for entry in stats.values())
+            output.append(f"Function: {func.__qualname__} at {code.co_filename}:{code.co_firstlineno}")
+            output.append(f"Total time: {TimeFormatter.format_time(total)}")
+            output.append("")
+            output.append(f"{'Line #':>6} {'Hits':>9} {'Time':>10} {'Per Hit':>10} {'% Time':>7}  Line Contents")
+            output.append("=" * 72)
+            try:
+                lines, first = inspect.getsourcelines(func)
+            except (OSError, TypeError):
+                # 源码不可用时只列出有记录的行
+                linenos = sorted(stats)
+                lines = [linecache.getline(code.co_filename, n) or "<source unavailable>\n" for n in linenos]
+            else:
+                linenos = range(first, first + len(lines))
+            for lineno, source in zip(linenos, lines):
+                source = source.rstrip("\n")
+                if lineno not in stats:
+                    output.append(f"{lineno:>6} {'':>9} {'':>10} {'':>10} {'':>7}  {source}")
+                    continue
+                hits, spent = stats[lineno]
+                per_hit = spent / hits if hits else 0.0
+                share = spent / total * 100 if total else 0.0
+                output.append(f"{lineno:>6} {int(hits):>9} {TimeFormatter.format_time(spent):>10} "
+                              f"{TimeFormatter.format_time(per_hit):>10} {share:>6.1f}%  {source}")
+            output.append("")
+        return "\n".join(output)
+
+
+class SamplingProfiler:
+    """
+    采样分析：后台线程按固定频率抓取执行线程的调用栈（sys._current_frames），
+    汇总为折叠栈，可输出给 flamegraph 工具。开销只与采样频率有关，与被测代码无关。
+    """
+
+    def __init__(self, hz: float = 100) -> None:
+        self.hz = hz
+        self.interval = 1.0 / hz
+        self.stacks: Dict[Tuple[str, ...], int] = {}
+        self.samples = 0
+        self.overhead = 0.0  # 采样线程自身耗时（秒）
+        self.wall = 0.0
+        self._started = 0.0
+        self._labels: Dict[CodeType, str] = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self._base_frame = None
+        self._target_id = None
+
+    def _label(self, code: CodeType) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            filename = os.path.basename(code.co_filename)
+            label = self._labels[code] = f"{code.co_name} ({filename}:{code.co_firstlineno})"
+        return label
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.interval):
+            started = time.perf_counter()
+            frame = sys._current_frames().get(self._target_id)
+            stack = []
+            # 只记录被测代码的栈帧，到进入 with 语句的帧为止
+            while frame is not None and frame is not self._base_frame:
+                if frame.f_code is _EXIT_CODE:
+                    stack = []  # 被测代码已结束，正在 __exit__ 中等待采样线程，不计入
+                    break
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                key = tuple(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+                self.samples += 1
+            self.overhead += time.perf_counter() - started
+
+    def __enter__(self) -> "SamplingProfiler":
+        self._base_frame = sys._getframe(1)
+        self._target_id = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, name="sampling-profiler", daemon=True)
+        self._started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.wall = time.perf_counter() - self._started
+        self._stop.set()
+        self._thread.join()
+        self._base_frame = None
+
+    @property
+    def rate(self) -> float:
+        """
+        实际采样频率：采样线程需要等待 GIL，频率受 sys.getswitchinterval() 限制，可能明显低于设定值。
+        """
+        return self.samples / self.wall if self.wall else 0.0
+
+    def collapsed(self) -> str:
+        """
+        折叠栈格式（每行 "f1;f2;f3 次数"），可直接交给 flamegraph.pl / speedscope。
+        """
+        return "".join(f"{';'.join(stack)} {count}\n"
+                       for stack, count in sorted(self.stacks.items(), key=lambda item: -item[1]))
+
+    def write_collapsed(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.collapsed())
+
+    def format_summary(self, limit: int = 15) -> str:
+        """
+        按自身样本数排序的函数列表，同时给出包含子调用的总样本数。
+        """
+        self_counts: Dict[str, int] = {}
+        total_counts: Dict[str, int] = {}
+        for stack, count in self.stacks.items():
+            self_counts[stack[-1]] = self_counts.get(stack[-1], 0) + count
+            for label in set(stack):
+                total_counts[label] = total_counts.get(label, 0) + count
+        samples = self.samples or 1
+        overhead = self.overhead / self.wall * 100 if self.wall else 0.0
+        output = [f"{self.samples} samples at {self.rate:.0f} Hz (requested {self.hz:g} Hz), "
+                  f"sampler overhead {overhead:.2f}% of {self.wall:.3f} s"]
+        # 容许少量样本的误差，避免很短的运行误报
+        if self.samples + 2 < self.wall * self.hz * 0.8:
+            output.append(f"Warning: sampling rate is limited by the GIL switch interval "
+                          f"({sys.getswitchinterval() * 1000:g} ms); results are coarser than requested")
+        output.append(f"{'Self %':>7} {'Total %':>8}  Function")
+        ranked = sorted(total_counts, key=lambda label: (-self_counts.get(label, 0), -total_counts[label]))
+        for label in ranked[:limit]:
+            output.append(f"{self_counts.get(label, 0) / samples * 100:>6.1f}% "
+                          f"{total_counts[label] / samples * 100:>7.1f}%  {label}")
+        return "\n".join(output)
+
+
+_EXIT_CODE = SamplingProfiler.__exit__.__code__
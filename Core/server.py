@@ -0,0 +1,203 @@
+# server.py
+
+import io
+import json
+import os
+import socket
+import sys
+import threading
+from typing import Callable, Dict, Optional
+
+
+def default_socket_path() -> str:
+    """
+    默认 Unix 域套接字路径，可通过环境变量 SINGLEPYTHON_SOCKET 覆盖。
+    """
+    if env_path := os.environ.get("SINGLEPYTHON_SOCKET"):
+        return env_path
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or "/tmp"
+    return os.path.join(runtime_dir, f"singlepython-{os.getuid()}.sock")
+
+
+def _send(sock: socket.socket, message: dict) -> None:
+    sock.sendall(json.dumps(message).encode("utf-8") + b"\n")
+
+
+class _ThreadRoutedStream:
+    """
+    按线程路由的标准输出/错误：处理请求的线程写入对应客户端，其他线程写入原始流。
+    """
+
+    def __init__(self, default, name: str) -> None:
+        self._default = default
+        self._name = name
+        self._local = threading.local()
+
+    def set_sink(self, sink: Optional[Callable[[str, str], None]]) -> None:
+        self._local.sink = sink
+
+    def write(self, text: str) -> int:
+        sink = getattr(self._local, "sink", None)
+        if sink is None:
+            return self._default.write(text)
+        if text:
+            sink(self._name, text)
+        return len(text)
+
+    def flush(self) -> None:
+        if getattr(self._local, "sink", None) is None:
+            self._default.flush()
+
+    def isatty(self) -> bool:
+        return False if getattr(self._local, "sink", None) else self._default.isatty()
+
+    @property
+    def forwarding(self) -> bool:
+        """
+        当前线程的输出正转发给客户端（子进程无法直接写入，需经由 write 转发）。
+        """
+        return getattr(self._local, "sink", None) is not None
+
+    def __getattr__(self, name):
+        return getattr(self._default, name)
+
+
+def _exit_status(code) -> int:
+    """
+    按解释器的规则把 SystemExit.code 转为退出码：None 为 0，整数原样，其他值为 1。
+    """
+    if code is None:
+        return 0
+    return code if isinstance(code, int) else 1
+
+
+class KernelServer:
+    """
+    常驻内核：在 Unix 域套接字上接收代码，按会话名分配独立的解释器命名空间，
+    同一会话内的请求串行执行，输出以 JSON 行流式返回给客户端。
+    """
+
+    def __init__(self, path: str) -> None:
+        from Core.batch import BatchRunner
+
+        self.path = path
+        self._runner_cls = BatchRunner
+        self.sessions: Dict[str, "BatchRunner"] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._sessions_lock = threading.Lock()
+        self._stdout = _ThreadRoutedStream(sys.stdout, "stdout")
+        self._stderr = _ThreadRoutedStream(sys.stderr, "stderr")
+
+    def _session(self, name: str):
+        with self._sessions_lock:
+            if name not in self.sessions:
+                self.sessions[name] = self._runner_cls(filename=f"<session:{name}>")
+                self._locks[name] = threading.Lock()
+            return self.sessions[name], self._locks[name]
+
+    def _handle(self, conn: socket.socket) -> None:
+        with conn, conn.makefile("rb") as reader:
+            try:
+                request = json.loads(reader.readline() or b"{}")
+            except ValueError:
+                _send(conn, {"done": True, "errors": 1, "message": "invalid request"})
+                return
+            runner, lock = self._session(str(request.get("session") or "default"))
+            code = request.get("code", "")
+
+            def sink(stream: str, text: str) -> None:
+                _send(conn, {"stream": stream, "data": text})
+
+            self._stdout.set_sink(sink)
+            self._stderr.set_sink(sink)
+            try:
+                with lock:
+                    errors_before = runner.interpreter.error_count
+                    status = None
+                    try:
+                        runner.run(io.StringIO(code))
+                    except SystemExit as e:
+                        sink("stderr", f"SystemExit: {e.code}\n")
+                        status = _exit_status(e.code)
+                    errors = runner.interpreter.error_count - errors_before
+                if status is None:
+                    status = 1 if errors else 0
+                _send(conn, {"done": True, "errors": errors, "status": status})
+            except OSError:
+                pass  # 客户端已断开
+            finally:
+                self._stdout.set_sink(None)
+                self._stderr.set_sink(None)
+
+    def _bind(self) -> socket.socket:
+        if os.path.exists(self.path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+            except OSError:
+                os.unlink(self.path)  # 上次异常退出留下的套接字文件
+            else:
+                raise RuntimeError(f"A SinglePython server is already listening on {self.path}")
+            finally:
+                probe.close()
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o077)  # 仅当前用户可连接
+        try:
+            server.bind(self.path)
+        finally:
+            os.umask(old_umask)
+        server.listen()
+        return server
+
+    def serve_forever(self) -> None:
+        server = self._bind()
+        sys.stdout, sys.stderr = self._stdout, self._stderr
+        print(f"SinglePython server listening on {self.path}")
+        try:
+            while True:
+                conn, _ = server.accept()
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+        except KeyboardInterrupt:
+            print("\nServer stopped.")
+        finally:
+            sys.stdout, sys.stderr = self._stdout._default, self._stderr._default
+            server.close()
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+
+def serve(path: Optional[str] = None) -> None:
+    """
+    启动常驻内核服务。
+    """
+    if not hasattr(socket, "AF_UNIX"):
+        raise RuntimeError("--server requires Unix domain socket support")
+    KernelServer(path or default_socket_path()).serve_forever()
+
+
+def connect(code: str, path: Optional[str] = None, session: str = "default") -> int:
+    """
+    轻量客户端：发送代码并将输出流式写到本地 stdout/stderr。
+    :return: 进程退出码：代码调用 sys.exit 时为其退出码，否则执行中出现异常时为 1
+    """
+    if not hasattr(socket, "AF_UNIX"):
+        raise RuntimeError("--connect requires Unix domain socket support")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path or default_socket_path())
+        _send(sock, {"session": session, "code": code})
+        with sock.makefile("rb") as reader:
+            for line in reader:
+                message = json.loads(line)
+                if message.get("done"):
+                    if text := message.get("message"):
+                        print(text, file=sys.stderr)
+                    if "status" in message:
+                        return message["status"]
+                    return 1 if message.get("errors") else 0
+                stream = sys.stderr if message.get("stream") == "stderr" else sys.stdout
+                stream.write(message.get("data", ""))
+                stream.flush()
+    print("Connection closed by server.", file=sys.stderr)
+    return 1
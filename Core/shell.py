@@ -5,11 +5,15 @@ import sys
 import os
 import subprocess
 import re
+import textwrap
 
 from prompt_toolkit import PromptSession
 from prompt_toolkit.auto_suggest import AutoSuggest, Suggestion
+from prompt_toolkit.completion import ThreadedCompleter
 from prompt_toolkit.history import History
 
+from Core.history import IndexedHistory, open_history
+
 class BlockAutoSuggestFromHistory(AutoSuggest):
     """
     基于历史记录的多行补全：每次建议以完整历史块为单位。
@@ -19,6 +23,10 @@ class BlockAutoSuggestFromHistory(AutoSuggest):
         text = document.text
         if not text.strip():
             return None
+        # 带前缀索引的历史直接查询，避免每次按键复制并扫描整个历史
+        if isinstance(history, IndexedHistory):
+            suggestion = history.suggest(text)
+            return Suggestion(suggestion) if suggestion else None
         # 倒序查找历史，找到以当前输入开头的完整历史块
         for entry in reversed(list(history.get_strings())):
             entry = entry.rstrip("\n")
@@ -27,19 +35,25 @@ class BlockAutoSuggestFromHistory(AutoSuggest):
                     return Suggestion(suggestion)
         return None
 
-from prompt_toolkit.history import InMemoryHistory
 from prompt_toolkit.key_binding import KeyBindings
 from prompt_toolkit.keys import Keys
-from prompt_toolkit.lexers import PygmentsLexer
+from prompt_toolkit.patch_stdout import patch_stdout
 from prompt_toolkit.styles import Style
-from pygments.lexers import PythonLexer
 
-from Core.interpreter import MyInteractiveInterpreter
+from Core.completion import CompletionIndex, PythonCompleter
+from Core.display import DisplayFormatter
+from Core.highlight import IncrementalPythonLexer
+from Core.interpreter import MyInteractiveInterpreter, StatementTracker
+from Core.jobs import JobManager
+from Core.output_cache import OutputCache
+from Core.parallel import ParallelPool
 from Core.magic_commands import MagicCommandHandler
+from Core.system import CAPTURE_COMMAND, ShellEscape
 from Core.utils import color_print, show_startup_info
 
-MULTILINE_KEYWORDS = {"if", "elif", "else", "for", "while", "def", "class"}
 DEDENT_KEYWORDS = {"elif", "else", "except", "finally"}
+PASTE_COMMAND_LINE = re.compile(r"(?:[%!]|[A-Za-z_]\w*\s*=\s*!)")  # 粘贴内容中顶格的魔法命令或 shell 命令
+PASTE_SHELL_COMMANDS = {"exit", "cls", "clear"}  # 粘贴内容中独占一行、顶格的 Shell 内置命令
 
 PROMPT_STYLE = Style.from_dict({
     'pygments.keyword': 'bold #ff79c6',
@@ -73,27 +87,38 @@ class SinglePythonShell:
             sys.stdout.write(f"\033[{shape} q")
             sys.stdout.flush()
 
-    def __init__(self, version_info=None):
+    def __init__(self, version_info=None, history_file=None):
         self.version_info = version_info
+        self.history_file = history_file
         self.multiline_comment = False
         self.buffered_code = []
+        self._tracker = StatementTracker()  # 增量判断 buffered_code 是否构成完整语句
         self._indent_stack = [0]  # 用于缓存缩进层级
         self.input_count = 1
+        self.interpreter = MyInteractiveInterpreter()
+        self.completion_index = CompletionIndex(self.interpreter.locals)
+        self.display = DisplayFormatter()
+        self.output_cache = OutputCache(namespace=self.interpreter.locals)
+        self.interpreter.locals["Out"] = self.output_cache
         self.session = self.init_prompt_session()
         self.prompt_message = f"In [{self.input_count}]: "
-        self.interpreter = MyInteractiveInterpreter()
-        self.first_line_processed = False
+        self.jobs = JobManager(self.interpreter)
+        self.parallel = ParallelPool(self.interpreter)
+        self.system = ShellEscape()
         self.magic_command_handler = MagicCommandHandler(self)
 
     def init_prompt_session(self):
         """
         初始化 prompt_toolkit 的会话，包括高亮、历史、样式和快捷键绑定。
         """
-        lexer = PygmentsLexer(PythonLexer)
-        self._history = InMemoryHistory()  # 持有 history 实例，便于后续操作
+        lexer = IncrementalPythonLexer()  # 按行缓存，只重新分析改动的部分
+        self._history = open_history(self.history_file)  # 持有 history 实例，便于后续操作
         return PromptSession(
             lexer=lexer,
             auto_suggest=BlockAutoSuggestFromHistory(),
+            # 补全在后台线程中计算，只在按 Tab 时触发
+            completer=ThreadedCompleter(PythonCompleter(self.completion_index)),
+            complete_while_typing=False,
             history=self._history,
             key_bindings=self.get_key_bindings(),
             style=PROMPT_STYLE,
@@ -107,7 +132,13 @@ class SinglePythonShell:
         @bindings.add(Keys.Tab)
         def handle_tab(event):
             buffer = event.app.current_buffer
-            buffer.insert_text(" " * 4)
+            if buffer.complete_state:
+                buffer.complete_next()
+            elif buffer.document.current_line_before_cursor.strip():
+                buffer.start_completion(insert_common_part=True)
+            else:
+                # 行首仍用 Tab 缩进
+                buffer.insert_text(" " * 4)
 
         @bindings.add("c-c")
         def handle_ctrl_c(event):
@@ -138,25 +169,13 @@ class SinglePythonShell:
         self.input_count += 1
         self.prompt_message = f"In [{self.input_count}]: "
 
-    def check_multiline_keywords(self, codes):
-        stripped_code = codes.strip()
-        if not stripped_code:
-            self.multiline_comment = False
-            return False
-        if stripped_code.endswith(":"):
-            first_word = stripped_code.split()[0] if stripped_code.split() else ""
-            if first_word in MULTILINE_KEYWORDS:
-                self.multiline_comment = True
-                return True
-        self.multiline_comment = False
-        return False
-
     def reset_state(self):
         self.buffered_code.clear()
         self._indent_stack = [0]
         self.increment_prompt()
         self.multiline_comment = False
-        self.first_line_processed = False
+        self._tracker.reset()
+        self.completion_index.refresh()  # 后台合并本次输入新增/删除的名字
 
     def handle_exception(self, e, message_prefix):
         print(f"{color_print(f'{message_prefix}:', 'red')} {e}")
@@ -190,34 +209,71 @@ class SinglePythonShell:
             self.reset_state()
             return True
         elif stripped_text.startswith("!"):
-            subprocess.run(stripped_text[1:], shell=True, check=False)
+            self.system.run(stripped_text[1:])
             self.reset_state()
             return True
-        elif stripped_text.startswith("%"):
-            self.magic_command_handler.handle_magic_command(text)
+        elif not self.buffered_code and (match := CAPTURE_COMMAND.match(stripped_text)):
+            # x = !cmd：输出按行收集为列表
+            self.interpreter.locals[match[1]] = self.system.run(match[2], capture=True)
             self.reset_state()
             return True
-        elif not stripped_text:
-            if self.multiline_comment:
-                try:
-                    compiled_code = compile("\n".join(self.buffered_code), "<input>", "exec")
-                    self.interpreter.runcode(compiled_code)
-                    self.reset_state()
-                except Exception as e:
-                    self.handle_exception(e, "Error")
-                return True
-        elif stripped_text in self.interpreter.locals:
-            print(f"Out[{self.input_count}]: {self.interpreter.locals[stripped_text]}\n")
+        elif stripped_text.startswith("%"):
+            self.magic_command_handler.handle_magic_command(text)
             self.reset_state()
             return True
         self._update_indent_stack(text)
         self.buffered_code.append(text)
-        if not self.first_line_processed:
-            self.check_multiline_keywords(text)
-            self.first_line_processed = True
+        # 只扫描新加入的一行；复合语句以空行结束，括号/字符串/续行未闭合时继续输入
+        self.multiline_comment = not self._tracker.feed(text)
         return False
 
 
+    def _run_block(self, source):
+        if not source.strip():
+            return
+        try:
+            codes = self.interpreter.compile_interactive(source)
+        except (OverflowError, SyntaxError, ValueError):
+            self.interpreter.showsyntaxerror()
+        else:
+            self.interpreter.run_codes(codes)
+
+    def run_pasted_block(self, text):
+        """
+        粘贴的多行代码块只去除一次公共缩进，整体编译为一个 exec 代码对象执行，
+        不再逐行经过 handle_user_input，耗时只取决于编译与执行本身。
+        位于逻辑行开头的顶格魔法命令/shell 命令以及 exit、cls、clear 将代码分段，按顺序执行。
+        :return: False 表示已处于多行输入中，需要退回逐行处理
+        """
+        if self.buffered_code:
+            return False
+        source = textwrap.dedent(text).strip("\n")
+        # 只有逻辑行开头的 %/! 才是命令，字符串或括号内的同样字符属于代码
+        tracker = StatementTracker(blank_line_ends_block=False)
+        segment = []
+        for line in source.split("\n"):
+            if not tracker.open and (PASTE_COMMAND_LINE.match(line) or line.rstrip() in PASTE_SHELL_COMMANDS):
+                self._run_block("\n".join(segment))
+                segment.clear()
+                self.handle_user_input(line)
+                continue
+            tracker.feed(line)
+            segment.append(line)
+        self._run_block("\n".join(segment))
+        self.reset_state()
+        return True
+
+    def displayhook(self, value):
+        """
+        表达式结果：按预算截断显示为 Out[n]，写入有上限的输出缓存，并更新 _、__、___。
+        """
+        if value is None:
+            return
+        self.display.show(value, f"Out[{self.input_count}]: ")
+        print()
+        self.output_cache.store(self.input_count, value)
+        self.output_cache.rotate(value, self.input_count)
+
     def get_next_indent(self):
         """
         结合缩进栈与上一行判断，支持多层嵌套、dedent、块首自动缩进。
@@ -236,6 +292,7 @@ class SinglePythonShell:
     def run(self):
         if self.version_info:
             show_startup_info(self.version_info)
+        original_displayhook, sys.displayhook = sys.displayhook, self.displayhook
         try:
             while True:
                 try:
@@ -244,25 +301,32 @@ class SinglePythonShell:
                     prompt_message = "   ...:" if self.multiline_comment else self.prompt_message
                     # 多层嵌套自动缩进
                     default_indent = self.get_next_indent()
-                    text = self.session.prompt(prompt_message, default=default_indent)
+                    if self.jobs.running():
+                        # 有后台作业时显示状态栏并定时刷新，作业输出打印在提示符上方
+                        with patch_stdout():
+                            text = self.session.prompt(prompt_message, default=default_indent,
+                                                       bottom_toolbar=self.jobs.toolbar, refresh_interval=0.5)
+                    else:
+                        text = self.session.prompt(prompt_message, default=default_indent,
+                                                   bottom_toolbar=None, refresh_interval=0)
                     # 输入后恢复为方块光标
                     self.set_cursor_shape(self.CURSOR_BLOCK)
 
                     # 优化历史记录：多行输入合并为一个历史项，避免重复
                     def add_history_entry(code_block):
                         if code_block and hasattr(self, '_history'):
-                            history_strings = list(self._history.get_strings())
-                            if not history_strings or history_strings[-1] != code_block:
+                            if self._history.last_string() != code_block:
                                 self._history.append_string(code_block)
 
-                    # 支持粘贴多行代码：如果输入包含换行符，逐行处理并自动缩进
+                    # 粘贴（bracketed paste）或调出的多行历史：整体编译执行，只记一条历史
                     if "\n" in text:
+                        if self.run_pasted_block(text):
+                            add_history_entry(text.strip("\n"))
+                            continue
+                        # 已处于多行输入中时逐行追加
                         lines = text.splitlines()
                         handled = False
-                        for idx, line in enumerate(lines):
-                            # 粘贴时自动缩进：上一行结尾冒号则补4空格
-                            if idx > 0 and lines[idx-1].rstrip().endswith(":") and not line.startswith("    "):
-                                line = f"    {line}"
+                        for line in lines:
                             if self.handle_user_input(line):
                                 handled = True
                                 break
@@ -278,10 +342,10 @@ class SinglePythonShell:
 
                     if not self.multiline_comment:
                         try:
-                            compiled_code = compile("\n".join(self.buffered_code), "<input>", "exec")
-                            self.interpreter.runcode(compiled_code)
+                            codes = self.interpreter.compile_interactive("\n".join(self.buffered_code))
+                            self.interpreter.run_codes(codes)
                             # 多行模式结束，合并历史
-                            add_history_entry("\n".join(self.buffered_code))
+                            add_history_entry("\n".join(self.buffered_code).rstrip())
                             self.reset_state()
                         except Exception as e:
                             self.buffered_code.clear()
@@ -298,6 +362,8 @@ class SinglePythonShell:
                     print("\nExiting...")
                     break
         finally:
+            sys.displayhook = original_displayhook
+            self.system.stop_persistent()
             # 程序退出时恢复为方块光标
             self.set_cursor_shape(self.CURSOR_BLOCK)
 
@@ -0,0 +1,35 @@
+# sizing.py
+
+import gc
+import sys
+import time
+import types
+from typing import Any, Tuple
+
+# 类型、模块、函数等为多处共享的对象，不计入某个值的大小
+_SHARED_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.CodeType)
+
+
+def deep_sizeof(obj: Any, budget: float) -> Tuple[int, bool]:
+    """
+    沿 gc.get_referents 遍历对象图累加 sys.getsizeof，类型、模块、函数等共享对象不计入。
+    :param budget: 遍历的时间预算（秒）
+    :return: (字节数, 是否在时间预算内遍历完成)，超时返回已统计的下限
+    """
+    deadline = time.perf_counter() + budget
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack:
+        item = stack.pop()
+        if id(item) in seen or isinstance(item, _SHARED_TYPES):
+            continue
+        seen.add(id(item))
+        try:
+            total += sys.getsizeof(item)
+        except Exception:
+            pass
+        stack.extend(gc.get_referents(item))
+        if len(seen) % 1024 == 0 and time.perf_counter() > deadline:
+            return total, False
+    return total, True
@@ -0,0 +1,192 @@
+# system.py
+
+import locale
+import os
+import re
+import shlex
+import signal
+import subprocess
+import sys
+import uuid
+from typing import Callable, Iterator, List, Optional, TextIO
+
+from Core.utils import color_print
+
+DEFAULT_SHELL = "/bin/sh"
+CAPTURE_COMMAND = re.compile(r"^([A-Za-z_]\w*)\s*=\s*!(.*)$")  # x = !cmd
+
+
+def _read_lines(stream: TextIO, interrupt: Callable[[], None]) -> Iterator[str]:
+    """
+    逐行读取子进程输出；读取时按下 Ctrl+C 只中断子进程，继续读到输出结束。
+    """
+    while True:
+        try:
+            line = stream.readline()
+        except KeyboardInterrupt:
+            interrupt()
+            continue
+        if not line:
+            return
+        yield line
+
+
+def _consume(lines: Iterator[str], interrupt: Callable[[], None], captured: Optional[List[str]]) -> None:
+    """
+    将输出逐行写到 sys.stdout（服务端模式下会转发给客户端），或收集到 captured 中。
+    """
+    while True:
+        try:
+            for line in lines:
+                if captured is not None:
+                    captured.append(line.rstrip("\n"))
+                else:
+                    sys.stdout.write(line)
+                    sys.stdout.flush()
+            return
+        except KeyboardInterrupt:
+            interrupt()
+
+
+class ShellCoprocess:
+    """
+    常驻的 /bin/sh 协进程：命令通过 stdin 发给同一个 shell 执行，省去每次 fork/exec 新 shell，
+    并保留 cd、export 等状态。每条命令后输出带随机标记的结束行以取回退出码。
+    协进程位于独立的进程组，Ctrl+C 时只向该进程组发送 SIGINT，shell 本身通过 trap 继续运行。
+    """
+
+    def __init__(self, executable: str = DEFAULT_SHELL) -> None:
+        self.executable = executable
+        self.returncode: Optional[int] = None
+        self.process = subprocess.Popen(
+            [executable], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            encoding=locale.getpreferredencoding(False), errors="replace", bufsize=1, start_new_session=True)
+        self._send("trap : INT\n")
+
+    @property
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def _send(self, text: str) -> None:
+        self.process.stdin.write(text)
+        self.process.stdin.flush()
+
+    def _interrupt(self) -> None:
+        try:
+            os.killpg(self.process.pid, signal.SIGINT)
+        except OSError:
+            pass
+
+    def _lines(self, token: str) -> Iterator[str]:
+        for line in _read_lines(self.process.stdout, self._interrupt):
+            head, found, status = line.partition(token)
+            if found:
+                if head:
+                    yield head  # 命令输出最后一行没有换行
+                self.returncode = int(status.strip() or 0)
+                return
+            yield line
+        self.close()
+        raise RuntimeError(f"{self.executable} coprocess exited (status {self.process.returncode}); "
+                           "it will be restarted without its previous state")
+
+    def run(self, command: str, captured: Optional[List[str]] = None) -> int:
+        """
+        在协进程中执行一条命令（stdin 重定向到 /dev/null，stderr 合并到输出）。
+        :return: 命令的退出码
+        """
+        token = f"__SINGLEPYTHON_DONE_{uuid.uuid4().hex}__"
+        self.returncode = None
+        # command eval：命令有语法错误时只报告错误，不会让非交互 shell 退出
+        self._send(f"{{ command eval {shlex.quote(command)}\n}} < /dev/null 2>&1\n"
+                   f"printf '%s %d\\n' {token} \"$?\"\n")
+        _consume(self._lines(token), self._interrupt, captured)
+        if self.returncode is None:
+            # 输出被 Ctrl+C 打断在中途，协议已不同步，放弃该协进程
+            self.close()
+            raise RuntimeError(f"{self.executable} coprocess was interrupted and has been stopped")
+        return self.returncode
+
+    def close(self) -> None:
+        if self.alive:
+            self.process.kill()
+        self.process.wait()
+
+
+def _interrupt_child(process: subprocess.Popen) -> None:
+    """
+    子进程与 Shell 同属前台进程组，终端的 Ctrl+C 已送达子进程；这里补发一次以防其未收到。
+    Windows 上 send_signal 不支持 SIGINT，直接终止子进程。
+    """
+    if process.poll() is not None:
+        return
+    if os.name == "nt":
+        process.terminate()
+    else:
+        process.send_signal(signal.SIGINT)
+
+
+class ShellEscape:
+    """
+    !cmd 与 x = !cmd 的执行器。!cmd 直接使用终端（vim、less、彩色输出等照常工作）；
+    x = !cmd 与服务端模式下输出经管道逐行读取，分别收集为列表或写入 sys.stdout 转发给客户端。
+    默认每次启动新的 shell；开启常驻模式（%sh on）后复用同一个 ShellCoprocess（输出总是经过管道）。
+    """
+
+    def __init__(self) -> None:
+        self.coprocess: Optional[ShellCoprocess] = None
+
+    @property
+    def persistent(self) -> bool:
+        return self.coprocess is not None
+
+    def start_persistent(self, executable: str = DEFAULT_SHELL) -> None:
+        if self.coprocess is None or not self.coprocess.alive:
+            self.coprocess = ShellCoprocess(executable)
+
+    def stop_persistent(self) -> None:
+        if self.coprocess is not None:
+            self.coprocess.close()
+            self.coprocess = None
+
+    def run(self, command: str, capture: bool = False) -> Optional[List[str]]:
+        """
+        执行 shell 命令。Ctrl+C 只中断子进程，Python 会话不受影响。
+        :param capture: True 时不显示输出，返回按行拆分的输出（含 stderr）
+        :return: capture 时为输出行列表，否则为 None
+        """
+        captured: Optional[List[str]] = [] if capture else None
+        sys.stdout.flush()
+        if self.coprocess is not None:
+            try:
+                if not self.coprocess.alive:
+                    self.coprocess = ShellCoprocess(self.coprocess.executable)
+                self.coprocess.run(command, captured)
+            except (OSError, RuntimeError) as e:
+                # 下一条命令会重新启动协进程
+                print(f"{color_print('Error:', 'red')} {e}", file=sys.stderr)
+            return captured
+        # 服务端模式下 sys.stdout 转发给客户端，子进程的输出必须经由 sys.stdout 写出
+        piped = capture or getattr(sys.stdout, "forwarding", False)
+        if not piped:
+            process = subprocess.Popen(command, shell=True)
+        else:
+            process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                       encoding=locale.getpreferredencoding(False), errors="replace", bufsize=1)
+
+        def interrupt() -> None:
+            _interrupt_child(process)
+
+        try:
+            if piped:
+                _consume(_read_lines(process.stdout, interrupt), interrupt, captured)
+        finally:
+            if piped:
+                process.stdout.close()
+            while True:
+                try:
+                    process.wait()
+                    break
+                except KeyboardInterrupt:
+                    interrupt()
+        return captured
@@ -2,7 +2,9 @@
 
 import platform
 import os
+import sys
 from functools import lru_cache
+from time import perf_counter
 from enum import Enum
 from typing import Union, Dict
 
@@ -76,25 +78,67 @@ def handle_exception(exception: Exception, msg_prefix: str) -> None:
     print(f"{color_print(f'{msg_prefix}:', 'red')} {exception}")
 
 
-# 文件内容缓存，提升为全局（或用lru_cache）
+class StartupProfiler:
+    """
+    启动耗时统计：按阶段记录耗时与新加载的模块数，启用时输出到 stderr。
+    """
+
+    def __init__(self, enabled: bool = False, t0: float = None, modules: int = None) -> None:
+        self.enabled = enabled
+        self._t0 = perf_counter() if t0 is None else t0
+        self._last = self._t0
+        self._last_modules = len(sys.modules) if modules is None else modules
+        self.phases: list[tuple[str, float, int]] = []
+
+    def mark(self, phase: str) -> None:
+        """
+        结束当前阶段并记录其耗时。
+        :param phase: 阶段名称
+        """
+        now = perf_counter()
+        modules = len(sys.modules)
+        self.phases.append((phase, now - self._last, modules - self._last_modules))
+        self._last, self._last_modules = now, modules
+
+    def report(self, file=None) -> None:
+        """
+        打印各阶段耗时报告，未启用时不输出。
+        """
+        if not self.enabled or not self.phases:
+            return
+        file = file or sys.stderr
+        total = self._last - self._t0
+        print(color_print("Startup profile:", Color.CYAN), file=file)
+        for phase, elapsed, new_modules in self.phases:
+            share = elapsed / total * 100 if total else 0.0
+            print(f"  {phase:<32} {elapsed * 1000:8.2f} ms {share:5.1f}%  (+{new_modules} modules)", file=file)
+        print(f"  {'total':<32} {total * 1000:8.2f} ms", file=file)
+
+
+# 文件内容缓存：以 mtime 和大小为键，文件变化后不会读到旧内容
 @lru_cache(maxsize=16)
-def _get_file_content(filename: str) -> str:
+def _get_file_content(filename: str, mtime_ns: int = 0, size: int = 0) -> str:
     with open(filename, "r", encoding="utf-8") as f:
         return f.read()
 
-def execute_code_from_file(filename: str) -> None:
+def execute_code_from_file(filename: str, cache=None) -> None:
     """
-    执行指定文件中的 Python 代码，带全局缓存和异常处理。
+    执行指定文件中的 Python 代码，带字节码缓存和异常处理。
     :param filename: 文件路径
+    :param cache: BytecodeCache 实例，为 None 时每次重新编译
     """
     try:
         if not os.path.isfile(filename):
             raise FileNotFoundError(f"File {filename} not found")
-        code_content = _get_file_content(filename)
+        st = os.stat(filename)
+        code_content = _get_file_content(filename, st.st_mtime_ns, st.st_size)
         if not code_content.strip():
             print(f"{color_print('SinglePython Warning:', Color.MAGENTA)} {filename} is empty")
             return
-        codes = compile(code_content, filename, "exec")
+        if cache is not None:
+            codes = cache.compile(code_content, filename, st)
+        else:
+            codes = compile(code_content, filename, "exec")
         exec(codes, {}, {})  # 受控命名空间，避免污染全局
         print(f"{color_print('SinglePython Info:', Color.MAGENTA)} {filename} executed successfully")
     except Exception as e:
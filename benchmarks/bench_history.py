@@ -0,0 +1,63 @@
+# bench_history.py
+"""
+历史建议查询的微基准：对比线性扫描与 IndexedHistory 前缀索引在不同历史规模下的延迟。
+用法：python benchmarks/bench_history.py [条数 ...]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prompt_toolkit.history import InMemoryHistory
+
+from Core.history import IndexedHistory
+
+SNIPPETS = [
+    "import {name}", "for {name} in range({n}):\n    print({name})", "{name} = [{n}, {n}]",
+    "def {name}_{n}(x):\n    return x * {n}", "print({name}, {n})", "%timeit {name}({n})",
+]
+PREFIXES = ["i", "for ", "print(", "def f", "%ti", "x", "zzz"]
+
+
+def make_entries(count, seed=0):
+    rng = random.Random(seed)
+    names = [f"var{i}" for i in range(500)]
+    return [rng.choice(SNIPPETS).format(name=rng.choice(names), n=rng.randrange(10_000)) for _ in range(count)]
+
+
+def linear_suggest(history, text):
+    for entry in reversed(list(history.get_strings())):
+        entry = entry.rstrip("\n")
+        if entry.startswith(text) and entry != text:
+            return entry[len(text):]
+    return None
+
+
+def bench(func, repeat=200):
+    start = time.perf_counter()
+    for i in range(repeat):
+        func(PREFIXES[i % len(PREFIXES)])
+    return (time.perf_counter() - start) / repeat
+
+
+def main(sizes):
+    print(f"{'entries':>10} {'append/op':>12} {'indexed':>12} {'linear':>12}")
+    for size in sizes:
+        entries = make_entries(size)
+        indexed, plain = IndexedHistory(), InMemoryHistory()
+        start = time.perf_counter()
+        for entry in entries:
+            indexed.append_string(entry)
+        append_cost = (time.perf_counter() - start) / size
+        for entry in entries:
+            plain.append_string(entry)
+        indexed_cost = bench(indexed.suggest, repeat=10_000)
+        linear_cost = bench(lambda text: linear_suggest(plain, text), repeat=20)
+        print(f"{size:>10} {append_cost * 1e6:>9.2f} us {indexed_cost * 1e6:>9.2f} us {linear_cost * 1e6:>9.0f} us")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [1_000, 10_000, 100_000, 200_000])
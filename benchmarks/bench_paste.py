@@ -0,0 +1,84 @@
+# bench_paste.py
+"""
+粘贴执行的微基准：对比整体编译的粘贴快速路径与旧的逐行路径，
+在不同粘贴行数下从回车到执行完成的耗时。
+旧路径每加入一行都用 code.compile_command 重新编译整个缓冲区判断语句是否完整，总开销为 O(n²)，
+行数较多时只测到 SLOW_LIMIT 行为止。
+用法：python benchmarks/bench_paste.py [行数 ...]
+"""
+
+import code
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prompt_toolkit.application import create_app_session
+from prompt_toolkit.input import create_pipe_input
+from prompt_toolkit.output import DummyOutput
+
+from Core.shell import SinglePythonShell
+
+BLOCK = [
+    "def f_{i}(x):",
+    "    if x > {i}:",
+    "        return [x * k for k in range(3)]",
+    "    return {{'x': x, 'i': {i}}}",
+    "r_{i} = f_{i}({i} % 7)",
+]
+
+
+def make_paste(lines):
+    source = []
+    i = 0
+    while len(source) < lines:
+        source.extend(line.format(i=i) for line in BLOCK)
+        i += 1
+    # 模拟从缩进代码中复制：整体带一层公共缩进
+    return "\n".join("    " + line for line in source[:lines])
+
+
+SLOW_LIMIT = 2000
+
+
+def line_by_line(shell, text):
+    """
+    复现旧路径：逐行加入缓冲区，每行都重新编译整个缓冲区探测语句是否完整，最后执行。
+    """
+    buffer = []
+    for line in text.splitlines():
+        buffer.append(line)
+        try:
+            code.compile_command("\n".join(buffer))
+        except (SyntaxError, ValueError, OverflowError):
+            pass  # 多条语句在 "single" 模式下无法编译，旧路径同样付出了这次编译
+    shell.interpreter.runcode(shell.interpreter.compile_cell("\n".join(buffer)))
+
+
+def bench(func, shell, text, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(shell, text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(sizes):
+    print(f"{'lines':>8} {'paste':>12} {'per line':>10} {'line-by-line':>14}")
+    with create_pipe_input() as pipe, create_app_session(input=pipe, output=DummyOutput()):
+        shell = SinglePythonShell()
+        for size in sizes:
+            text = make_paste(size)
+            fast = bench(lambda sh, t: sh.run_pasted_block(t), shell, text, repeat=5)
+            if size > SLOW_LIMIT:
+                print(f"{size:>8} {fast * 1e3:>9.2f} ms {fast / size * 1e6:>7.2f} us {'(skipped)':>14}")
+                continue
+            # 旧路径无法处理带公共缩进的代码，先去掉缩进再测
+            slow = bench(line_by_line, shell, "\n".join(line[4:] for line in text.splitlines()), repeat=3)
+            print(f"{size:>8} {fast * 1e3:>9.2f} ms {fast / size * 1e6:>7.2f} us {slow * 1e3:>11.2f} ms")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [10, 100, 1000, 5000, 20000])
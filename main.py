@@ -2,53 +2,96 @@
 
 import sys
 import time
+
+# 尽早记录，用于 --startup-profile
+_STARTUP_T0 = time.perf_counter()
+_STARTUP_MODULES = len(sys.modules)
+
 import traceback
 from argparse import ArgumentParser
-from concurrent.futures import ThreadPoolExecutor
-
-from tqdm import tqdm
 
 from Core.config import SinglePythonInfo
-from Core.shell import SinglePythonShell
-from Core.utils import execute_code_from_file, get_version
+from Core.utils import StartupProfiler, execute_code_from_file, get_version
 
 
-def init():
+def build_shell(profiler: StartupProfiler, history_file: str = None):
     """
-    初始化进度条显示。
+    延迟导入并构建交互式 shell，prompt_toolkit/pygments 仅在此时加载。
     """
-    print("Initializing...")
-    for _ in tqdm(range(100), desc="Initialization", ncols=75, leave=False):
-        time.sleep(0.001)  # 更快的进度条
-    print("Initialization complete.")
-    sys.stdout.write("\x1b[A" * 3)
-    sys.stdout.flush()
+    from Core.shell import SinglePythonShell
+    from Core.history import default_history_path
+    profiler.mark("import Core.shell")
+    shell = SinglePythonShell(SinglePythonInfo, history_file=history_file or default_history_path())
+    profiler.mark("build SinglePythonShell")
+    return shell
 
 
 def main():
     """
     主程序入口，解析命令行参数，执行文件或进入交互式 shell。
     """
+    profiler = StartupProfiler(t0=_STARTUP_T0, modules=_STARTUP_MODULES)
+    profiler.mark("import core modules")
+
     parser = ArgumentParser(description="Interactive Python Shell with additional features.")
     parser.add_argument("file", nargs='?', type=str, help="Execute Python code from the specified file")
     parser.add_argument("-i", "--interactive", action="store_true",
                         help="Enter interactive mode after executing a file.")
+    parser.add_argument("--batch", action="store_true",
+                        help="Read code from stdin without terminal rendering (default when stdin is not a TTY).")
+    parser.add_argument("--server", action="store_true", help="Run a resident kernel on a Unix domain socket.")
+    parser.add_argument("--connect", action="store_true",
+                        help="Send the file (or stdin) to a running --server and stream its output back.")
+    parser.add_argument("--socket", type=str, default=None,
+                        help="Socket path for --server/--connect (default: SINGLEPYTHON_SOCKET or a per-user path).")
+    parser.add_argument("--session", type=str, default="default",
+                        help="Named server session to run in; each session has its own namespace.")
+    parser.add_argument("--cache-dir", type=str, default=None,
+                        help="Directory for the compiled bytecode cache (default: SINGLEPYTHON_CACHE_DIR or user cache).")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the bytecode cache.")
+    parser.add_argument("--history-file", type=str, default=None,
+                        help="Persistent history file shared across shells (default: SINGLEPYTHON_HISTORY or ~/.singlepython_history).")
+    parser.add_argument("--startup-profile", action="store_true",
+                        help="Report where startup time went (printed to stderr).")
     parser.add_argument("-v", "--version", action="version", version=get_version(), help="Show version information")
     args = parser.parse_args()
+    profiler.enabled = args.startup_profile
+    profiler.mark("parse arguments")
 
     try:
-        if args.file:
-            execute_code_from_file(args.file)  # 直接调用，无需线程池
-            if args.interactive:
-                shell = SinglePythonShell(SinglePythonInfo)
-                init()
-                shell.run()
+        if args.server:
+            from Core.server import serve
+            serve(args.socket)
+            return
+        if args.connect:
+            from Core.server import connect
+            if args.file:
+                with open(args.file, "r", encoding="utf-8") as f:
+                    code = f.read()
             else:
+                code = sys.stdin.read()
+            profiler.mark("read input")
+            profiler.report()
+            sys.exit(connect(code, args.socket, args.session))
+        if args.file:
+            cache = None
+            if not args.no_cache:
+                from Core.bytecode_cache import BytecodeCache
+                cache = BytecodeCache(args.cache_dir)
+            execute_code_from_file(args.file, cache)
+            profiler.mark(f"execute {args.file}")
+            if not args.interactive:
+                profiler.report()
                 sys.exit(0)
-        else:
-            shell = SinglePythonShell(SinglePythonInfo)
-            init()
-            shell.run()
+        if args.batch or not sys.stdin.isatty():
+            from Core.batch import run_batch
+            profiler.mark("import Core.batch")
+            profiler.report()
+            run_batch()
+            return
+        shell = build_shell(profiler, args.history_file)
+        profiler.report()
+        shell.run()
     except Exception as e:
         print(f"An error occurred: {e}")
         traceback.print_exc()
@@ -56,4 +99,8 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if getattr(sys, "frozen", False):
+        # PyInstaller 打包后 %pmap 的工作进程需要
+        import multiprocessing
+        multiprocessing.freeze_support()
+    main()
@@ -0,0 +1,56 @@
+# test_statement_tracker.py
+
+import pytest
+
+from Core.interpreter import StatementTracker
+
+
+def feed_all(lines, blank_line_ends_block=True):
+    tracker = StatementTracker(blank_line_ends_block)
+    return tracker, [tracker.feed(line) for line in lines]
+
+
+@pytest.mark.parametrize("lines", [
+    ["@d", "def f(): pass"],
+    ["@d", "class A: x = 1"],
+    ["@d", "@e", "async def f(): return 1"],
+    ["@d", "def f(): return {", "    1}"],
+])
+def test_decorated_one_line_definition_is_complete(lines):
+    tracker, results = feed_all(lines)
+    assert results == [False] * (len(lines) - 1) + [True]
+    assert not tracker.in_block
+
+
+def test_decorated_block_ends_on_blank_line():
+    _, results = feed_all(["@d", "def f():", "    pass", ""])
+    assert results == [False, False, False, True]
+
+
+def test_blank_line_after_decorated_one_line_definition():
+    tracker, results = feed_all(["@staticmethod", "def h(): pass"])
+    assert results[-1]
+    assert tracker.feed("")
+    assert tracker.feed("''")
+
+
+def test_except_star_continues_try_block():
+    lines = ["try:", "    pass", "except* ValueError:", "    pass", ""]
+    _, results = feed_all(lines)
+    assert results == [False, False, False, False, True]
+
+
+def test_batch_mode_blank_line_keeps_block_open():
+    tracker, results = feed_all(["def f():", "    x = 1", "", "    return x"], blank_line_ends_block=False)
+    assert results == [False, False, False, False]
+    assert tracker.can_close()
+
+
+@pytest.mark.parametrize("lines", [
+    ["x = (1,", "2)"],
+    ['s = """', "text", '"""'],
+    ["x = 1 + \\", "2"],
+])
+def test_open_logical_line_completes_when_closed(lines):
+    _, results = feed_all(lines)
+    assert results == [False] * (len(lines) - 1) + [True]